@@ -0,0 +1,195 @@
+"""NumPy による evaluate_board のバッチ版。
+
+局面を「駒コードの盤面・持ち駒・玉の位置・王手フラグ」に符号化し、盤面は
+駒コードごとの one-hot プレーン (N, 32, 81) に展開して、駒価値+位置評価や
+玉周辺の項をテーブルとの内積でまとめて計算する。結果は
+ShogiGame.evaluate_board と完全に一致する（check_parity で確認できる）。
+
+    python batch_eval.py [局面数]
+"""
+import random
+import sys
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+import cshogi
+
+from game_logic import (
+    ShogiGame, SENTE, GOTE, BOARD_SIZE, KING_NEIGHBORS,
+    PSQ_BY_CODE, MATERIAL_BY_CODE, DEFENDER_BY_CODE, HAND_VALUES,
+)
+
+NO_KING = 81  # 玉がいない色の玉位置（テーブルの末尾に全て 0 の行を置く）
+N_CODES = 32
+# 符号化した1局面のバイト列: 盤面81 + 持ち駒14 + 玉の位置2 + 王手フラグ2
+RECORD_SIZE = 81 + 14 + 2 + 2
+
+
+def encode_position(game):
+    """ShogiGame の現局面をバッチ評価用のバイト列に符号化する。"""
+    king_sq = [NO_KING if k is None else k for k in game._king_sq]
+    checks = [game.is_king_in_check(SENTE), game.is_king_in_check(GOTE)]
+    return bytes(game._squares) + bytes(game._hands[0] + game._hands[1] + king_sq + checks)
+
+
+class BatchEvaluator:
+    """evaluate_board と同じ評価を複数局面まとめて計算する。"""
+
+    def __init__(self):
+        if np is None:
+            raise RuntimeError("numpy is required for batch evaluation")
+        squares = np.arange(81)
+
+        self.psq = np.zeros((N_CODES, 81), dtype=np.int64)
+        for code, table in enumerate(PSQ_BY_CODE):
+            if table is not None:
+                self.psq[code] = table
+        self.psq_flat = self.psq.reshape(-1).astype(np.float64)
+        self.codes = np.arange(N_CODES)
+        self.material = np.array(MATERIAL_BY_CODE, dtype=np.int64)
+        self.hand_values = np.array(HAND_VALUES, dtype=np.int64)
+
+        # 玉の安全度のうち盤上の駒ごとに足し合わせられる部分
+        # king_linear[color, 玉のマス, 駒コード, マス] = 2a の守り駒ボーナス + 2b の大駒の脅威
+        self.king_linear = np.zeros((2, NO_KING + 1, N_CODES, 81), dtype=np.int64)
+        # 周囲8マス（空きマスの数を数える）と 2c の端玉ボーナス
+        self.neighbor_mask = np.zeros((NO_KING + 1, 81), dtype=bool)
+        self.edge_bonus = np.zeros((2, NO_KING + 1), dtype=np.int64)
+        # 4. 歩の防壁: 玉の前方3筋を玉に近い順に並べたマス（盤外の筋・足りない分は 81 = 空き）
+        self.shield_scan = np.full((2, NO_KING + 1, 3, 8), 81, dtype=np.int64)
+        self.shield_offboard = np.zeros((2, NO_KING + 1), dtype=np.int64)
+
+        for k in range(81):
+            kx, ky = k % 9, k // 9
+            self.neighbor_mask[k, list(KING_NEIGHBORS[k])] = True
+            for color, owner in ((0, SENTE), (1, GOTE)):
+                table = self.king_linear[color, k]
+                for i in KING_NEIGHBORS[k]:
+                    for code in range(1, N_CODES):
+                        if DEFENDER_BY_CODE[code] and code >> 4 == color:
+                            table[code, i] += DEFENDER_BY_CODE[code]
+                enemy = (color ^ 1) * 16
+                x2, y2 = squares % 9, squares // 9
+                line = (x2 == kx) | (y2 == ky)
+                near = np.maximum(abs(x2 - kx), abs(y2 - ky)) <= 2
+                diag = (abs(x2 - kx) == abs(y2 - ky)) & (x2 != kx)
+                rook_threat = np.where(line, -np.maximum(0, 400 - (abs(x2 - kx) + abs(y2 - ky)) * 30), 0)
+                bishop_threat = np.where(diag, -np.maximum(0, 300 - abs(x2 - kx) * 25), 0)
+                table[enemy + cshogi.ROOK] += rook_threat
+                table[enemy + cshogi.PROM_ROOK] += rook_threat + np.where(near, -300, 0)
+                table[enemy + cshogi.BISHOP] += bishop_threat
+                table[enemy + cshogi.PROM_BISHOP] += bishop_threat + np.where(near, -250, 0)
+
+                if (owner == SENTE and ky >= 7) or (owner == GOTE and ky <= 1):
+                    if kx <= 1 or kx >= 7:
+                        self.edge_bonus[color, k] = 80
+
+                ahead = range(ky - 1, -1, -1) if owner == SENTE else range(ky + 1, BOARD_SIZE)
+                for j, col in enumerate((kx - 1, kx, kx + 1)):
+                    if col < 0 or col >= BOARD_SIZE:
+                        self.shield_offboard[color, k] += 1
+                        continue
+                    for n, check_y in enumerate(ahead):
+                        self.shield_scan[color, k, j, n] = check_y * 9 + col
+
+        self.shield_scores = np.array([-300, -150, -50, 0], dtype=np.int64)
+
+    def evaluate(self, positions):
+        """encode_position で符号化した局面のリストを評価し、float64 配列で返す。"""
+        n = len(positions)
+        records = np.frombuffer(b"".join(positions), dtype=np.uint8).reshape(n, RECORD_SIZE).astype(np.int64)
+        boards = records[:, :81]
+        hands = records[:, 81:95].reshape(n, 2, 7)
+        kings = records[:, 95:97]
+        checks = records[:, 97:99].astype(bool)
+        rows = np.arange(n)
+        squares = np.arange(81)
+
+        # 駒コードごとの one-hot プレーン
+        planes = boards[:, None, :] == self.codes[None, :, None]
+
+        hand_value = hands @ self.hand_values  # (n, 2)
+        material = self.material[boards].sum(axis=1) + hand_value.sum(axis=1)
+        hand_multiplier = np.where(material < 4000, 1.6, 1.3)
+
+        # 1. 駒価値 + 位置評価 / 3. 大駒侵入ペナルティ（整数値なので float64 の内積でも誤差は出ない）
+        score = (planes.reshape(n, -1) @ self.psq_flat).astype(np.int64)
+
+        padded = np.concatenate([boards, np.zeros((n, 1), dtype=np.int64)], axis=1)
+        for color in (0, 1):
+            sign = 1 if color == 1 else -1
+            k = kings[:, color]
+            has_king = k != NO_KING
+
+            # 2. 玉の安全度
+            safety = self.king_linear[color, k[:, None], boards, squares].sum(axis=1)
+            empty = ((boards == 0) & self.neighbor_mask[k]).sum(axis=1)
+            safety -= np.where(empty >= 5, 200, np.where(empty >= 3, 80, 0))
+            safety += self.edge_bonus[color, k]
+
+            # 4. 歩の防壁: 前方を辿って最初に当たるのが自分の歩なら防壁あり
+            codes = padded[rows[:, None, None], self.shield_scan[color, k]]  # (n, 3, 8)
+            pawn_hit = codes == color * 16 + cshogi.PAWN
+            hit = pawn_hit | ((codes != 0) & ((codes >> 4) != color))
+            first = hit.argmax(axis=2)
+            has_pawn = hit.any(axis=2) & np.take_along_axis(pawn_hit, first[..., None], axis=2)[..., 0]
+            shield = has_pawn.sum(axis=1) + self.shield_offboard[color, k]
+
+            score += np.where(has_king, sign * (safety + self.shield_scores[shield]), 0)
+
+            # 5. 王手状態のペナルティ
+            score += np.where(checks[:, color], sign * -500, 0)
+
+        # 6. 持ち駒（スカラー版と同じ順序で float 演算して丸めまで一致させる）
+        result = score.astype(np.float64) + hand_value[:, 1] * hand_multiplier
+        return result - hand_value[:, 0] * hand_multiplier
+
+
+_evaluator = None
+
+
+def get_batch_evaluator():
+    """テーブル構築は重いので、プロセス内で1つだけ作って使い回す。"""
+    global _evaluator
+    if _evaluator is None:
+        _evaluator = BatchEvaluator()
+    return _evaluator
+
+
+def random_positions(count, seed=0):
+    """パリティ確認用: 固定シードのランダム対局から局面の SFEN を集める。"""
+    rng = random.Random(seed)
+    sfens = []
+    while len(sfens) < count:
+        board = cshogi.Board()
+        for _ in range(rng.randint(0, 160)):
+            moves = list(board.legal_moves)
+            if not moves:
+                break
+            captures = [m for m in moves if cshogi.move_cap(m)]
+            board.push(rng.choice(captures if captures and rng.random() < 0.5 else moves))
+        sfens.append(board.sfen())
+    return sfens
+
+
+def check_parity(sfens):
+    """各局面について、バッチ評価と evaluate_board が一致しない SFEN のリストを返す。"""
+    games = []
+    for sfen in sfens:
+        game = ShogiGame()
+        game.from_sfen(sfen)
+        games.append(game)
+    batch = get_batch_evaluator().evaluate([encode_position(g) for g in games])
+    return [sfen for sfen, game, value in zip(sfens, games, batch) if game.evaluate_board() != value]
+
+
+if __name__ == "__main__":
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 500
+    mismatches = check_parity(random_positions(count))
+    print(f"{count - len(mismatches)}/{count} positions match evaluate_board")
+    for sfen in mismatches:
+        print("MISMATCH", sfen)
+    sys.exit(1 if mismatches else 0)
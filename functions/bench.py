@@ -0,0 +1,295 @@
+"""game_logic のベンチマーク: 固定の局面集で基本操作の1回あたりの時間と探索速度を測る。
+
+結果は JSON で書き出し、保存しておいた基準の結果と比べて、しきい値を超えて遅くなった
+項目を回帰として報告する（回帰があれば終了コード 1）。探索は乱数のシードを固定し、
+定跡と詰み探索を切って読むので、ノード数が変わったら探索の中身が変わったことになる。
+
+    python bench.py                                  # 測って表示
+    python bench.py --out bench.json                 # 結果を保存
+    python bench.py --baseline bench.json [--threshold 0.1]  # 基準と比べる
+    python bench.py --drop-pruning                   # 打つ手の絞り込みの有無で探索を比べる
+"""
+import argparse
+import json
+import platform
+import sys
+import time
+
+import cshogi
+
+import game_logic
+from game_logic import ShogiGame, GOTE
+
+# 局面集: 序盤・中盤・手筋（詰みや駒の取り合いがある局面）・終盤
+CORPUS = {
+    "opening": [
+        "lnsgkgsnl/1r5b1/ppppppppp/9/9/9/PPPPPPPPP/1B5R1/LNSGKGSNL b - 1",
+        "lnsgkgsnl/1r5b1/p1pppp1pp/1p4p2/9/2P4P1/PP1PPPP1P/1B5R1/LNSGKGSNL b - 5",
+        "ln1g1gsnl/1r1s2kb1/p1pppp1pp/1p4p2/9/2PP5/PP2PPPPP/1B1R2K2/LNSG1GSNL b - 11",
+        "lnsgkg1nl/1r5s1/p1pppp1pp/6p2/1p7/2P4P1/PPSPPPP1P/7R1/LN1GKGSNL b Bb 11",
+    ],
+    "middlegame": [
+        "lnsg1g1nl/4k1sb1/p1ppp1ppp/1r3p3/9/P3PP3/2PP2PPP/1BGS3R1/LN2KGSNL b Pp 17",
+        "1n2gksnl/l1rs1g3/p1ppp2p1/1p3pp1p/P8/7P1/1PNPPPP1P/1BGS2GRL/L3BKSN1 b p 29",
+        "1n2kgs2/lr1s1g1bl/p3ppn2/1ppp3pp/4PN3/P1P4P1/1P1PGP2P/L3KGR2/1NS3SBL w Pp 44",
+        "l3k2nl/r1+N1gs3/ppnp1p3/4p3p/6P2/1PS1PG1P1/P1NP2S1P/1B7/L1SGKG1RL w B5P 46",
+    ],
+    "tactical": [
+        "ln1pg1k2/r1+B3s1l/pps2p1p1/5gp1p/P8/1PPP4P/L1S1PP+nP1/1G2K1GRN/B5SNL b 2Pp 57",
+        "2k5n/4p4/ppb+R5/1g1p5/8s/4PK3/1N1+p1n3/+lGP6/3GS4 b RBS2L6Pgsnl5p 145",
+        "l1+Bs5/7k1/1pp6/p7p/1P7/2PSPNL1P/P1gGSRPP1/4RSK2/LN2G2NL b BGN7P 101",
+        "5g3/5k3/G2+N1p3/9/8+R/Lpp1b4/P5p1P/8S/s1GK1+l2L w BGS2N9Prsnl3p 156",
+    ],
+    "endgame": [
+        "l2k2s2/7p1/ppP1GG3/3G2+S2/1r7/4+n2P1/P2P4+l/3K1S2N/L+r1b1G1NL w 5Pbsn6p 74",
+        "1k5nl/2g1g4/3p4p/5ps2/8P/5G2L/PPBK2P2/6G2/L1S3SN1 w 2RSNL6Pbn5p 74",
+        "1k5l1/7sn/3PL4/3p2ppP/5s3/PPG6/1L4P2/L1K2S2g/1N1G5 b RBS6Prbg2n4p 111",
+        "ln2k4/1+L4P2/4s1+Pp1/3p5/1p2PP3/8l/1K4pP1/3P2+l1p/1B2g4 w 2S2N2P2rb3gsn5p 112",
+    ],
+}
+
+SEARCH_DEPTH = 4
+REPEAT = 5          # 基本操作は REPEAT 回測って最速の回を使う（ほかのプロセスの影響を減らす）
+CALLS = 100         # 1回の計測で同じ操作を1局面あたり何回呼ぶか
+SEARCH_REPEAT = 3   # 探索は局面ごとに SEARCH_REPEAT 回読んで最速の回を使う（シード固定なので木は毎回同じ）
+THRESHOLD = 0.10    # 基準より 10% 以上遅くなったら回帰とみなす
+
+
+def corpus_sfens():
+    return [sfen for sfens in CORPUS.values() for sfen in sfens]
+
+
+def _new_game(sfen):
+    game = ShogiGame()
+    game._opening_book = None
+    game.from_sfen(sfen)
+    return game
+
+
+def _time_per_call(setup, func, calls):
+    """各局面で func を calls 回呼んだ時間の合計と呼び出し回数を返す。"""
+    total = 0.0
+    count = 0
+    for sfen in corpus_sfens():
+        args = setup(sfen)
+        start = time.perf_counter()
+        for _ in range(calls):
+            func(*args)
+        total += time.perf_counter() - start
+        count += calls
+    return total, count
+
+
+def _apply_undo_all(game, moves):
+    for move in moves:
+        game._apply_move(move)
+        game._undo_move()
+
+
+def bench_micro(repeat=REPEAT, calls=CALLS):
+    """基本操作の1回あたりの時間（マイクロ秒）"""
+    def with_game(sfen):
+        return (_new_game(sfen),)
+
+    def with_moves(sfen):
+        game = _new_game(sfen)
+        return game, list(game._cb.legal_moves)
+
+    cases = {
+        "get_legal_moves": (with_game, lambda g: g.get_legal_moves(g.turn)),
+        "evaluate_board": (with_game, lambda g: g.evaluate_board()),
+        "get_sfen": (with_game, lambda g: g.get_sfen()),
+        "from_sfen": (lambda sfen: (ShogiGame(), sfen), lambda g, sfen: g.from_sfen(sfen)),
+        "_generate_captures": (with_game, lambda g: g._generate_captures(g.turn)),
+    }
+    # 計測の回は操作ごとにまとめず交互に回し、負荷の変動がどの操作にも同じようにかかるようにする
+    best = {}
+    for _ in range(repeat):
+        for name, (setup, func) in cases.items():
+            elapsed, count = _time_per_call(setup, func, calls)
+            best[name] = min(best.get(name, elapsed / count), elapsed / count)
+
+        # _apply_move / _undo_move は局面の合法手を全部1回ずつ指して戻し、1組あたりの時間にする
+        elapsed, pairs = 0.0, 0
+        for sfen in corpus_sfens():
+            game, moves = with_moves(sfen)
+            start = time.perf_counter()
+            for _ in range(calls // 10 or 1):
+                _apply_undo_all(game, moves)
+            elapsed += time.perf_counter() - start
+            pairs += len(moves) * (calls // 10 or 1)
+        per_pair = elapsed / max(1, pairs)
+        best["_apply_move+_undo_move"] = min(best.get("_apply_move+_undo_move", per_pair), per_pair)
+    return {name: round(value * 1e6, 3) for name, value in best.items()}
+
+
+def bench_search(depth=SEARCH_DEPTH, repeat=SEARCH_REPEAT, drop_pruning=True):
+    """各局面を深さ depth まで読んだ時間・ノード数と、深さごとのノード数・分岐数
+
+    drop_pruning=False なら打つ手の絞り込み（USE_DROP_PRUNING）を切って読む。
+    """
+    saved = game_logic.USE_MATE_SEARCH, game_logic.USE_DROP_PRUNING
+    game_logic.USE_MATE_SEARCH = False  # 詰みのある局面でも探索そのものを測る
+    game_logic.USE_DROP_PRUNING = drop_pruning
+    positions = []
+    try:
+        for category, sfens in CORPUS.items():
+            for sfen in sfens:
+                elapsed = None
+                for _ in range(repeat):
+                    game = _new_game(sfen)
+                    start = time.perf_counter()
+                    val, move = game.iterative_deepening(game.turn == GOTE, time_limit=3600, max_depth=depth,
+                                                         soft_limit=3600, seed=0)
+                    run_time = time.perf_counter() - start
+                    elapsed = run_time if elapsed is None else min(elapsed, run_time)
+                stats = game.search_stats
+                positions.append({
+                    "category": category,
+                    "sfen": sfen,
+                    "time": round(elapsed, 4),
+                    "depth": stats["depth"],
+                    "nodes": stats["nodes"],
+                    "qnodes": stats["qnodes"],
+                    "move": stats["move"],
+                    "val": val,
+                    "branching": stats["branching"],
+                    "first_move_cutoff_rate": stats["first_move_cutoff_rate"],
+                    "drops_pruned": stats["drops_pruned"],
+                    "nodes_per_depth": [it["nodes"] for it in stats["iterations"]],
+                    "branching_per_depth": [it["branching"] for it in stats["iterations"]],
+                })
+    finally:
+        game_logic.USE_MATE_SEARCH, game_logic.USE_DROP_PRUNING = saved
+
+    def summarize(rows):
+        elapsed = sum(r["time"] for r in rows)
+        nodes = sum(r["nodes"] for r in rows)
+        qnodes = sum(r["qnodes"] for r in rows)
+        nodes_per_depth = [sum(r["nodes_per_depth"][i] for r in rows if i < len(r["nodes_per_depth"]))
+                           for i in range(max(len(r["nodes_per_depth"]) for r in rows))]
+        return {"time": round(elapsed, 4), "nodes": nodes, "qnodes": qnodes,
+                "nps": int((nodes + qnodes) / elapsed) if elapsed > 0 else 0,
+                "branching": round(sum(r["branching"] or 0 for r in rows) / len(rows), 2),
+                "first_move_cutoff_rate": round(sum(r["first_move_cutoff_rate"] or 0 for r in rows) / len(rows), 3),
+                "drops_pruned": sum(r["drops_pruned"] for r in rows),
+                "nodes_per_depth": nodes_per_depth}
+
+    categories = {c: summarize([r for r in positions if r["category"] == c]) for c in CORPUS}
+    return {"depth": depth, "drop_pruning": drop_pruning, "total": summarize(positions),
+            "categories": categories, "positions": positions}
+
+
+def bench_drop_pruning(depth=SEARCH_DEPTH, repeat=SEARCH_REPEAT):
+    """打つ手の絞り込みの有無で同じ局面集を読み、カテゴリごとの集計を {"on": ..., "off": ...} で返す。"""
+    return {name: {key: row for key, row in [("total", result["total"])] + list(result["categories"].items())}
+            for name, result in (("on", bench_search(depth, repeat, True)),
+                                 ("off", bench_search(depth, repeat, False)))}
+
+
+def run(depth=SEARCH_DEPTH, repeat=REPEAT, calls=CALLS, search_repeat=SEARCH_REPEAT, drop_pruning=False):
+    result = {
+        "meta": {
+            "python": platform.python_version(),
+            "cshogi": getattr(cshogi, "__version__", "unknown"),
+            "platform": platform.platform(),
+            "positions": len(corpus_sfens()),
+            "date": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        },
+        "micro_us": bench_micro(repeat, calls),
+        "search": bench_search(depth, search_repeat),
+    }
+    if drop_pruning:
+        result["drop_pruning"] = bench_drop_pruning(depth, search_repeat)
+    return result
+
+
+def compare(result, baseline, threshold=THRESHOLD):
+    """基準と比べて、時間が threshold 以上増えた・NPS や1手目カット率が threshold 以上下がった項目を返す。
+
+    ノード数・最善手が変わった局面も探索の変化として notes に入れる（回帰には数えない）。
+    """
+    regressions = []
+    notes = []
+
+    def check_time(name, new, old):
+        if old and new > old * (1 + threshold):
+            regressions.append(f"{name}: {old} -> {new} (+{(new / old - 1) * 100:.0f}%)")
+
+    for name, old in baseline.get("micro_us", {}).items():
+        if name in result["micro_us"]:
+            check_time(f"micro {name} [us]", result["micro_us"][name], old)
+
+    base_search = baseline.get("search", {})
+    if base_search.get("depth") != result["search"]["depth"]:
+        notes.append(f"search depth differs ({base_search.get('depth')} vs {result['search']['depth']}), "
+                     "search not compared")
+        return regressions, notes
+    for key, new in [("total", result["search"]["total"])] + list(result["search"]["categories"].items()):
+        old = base_search["total"] if key == "total" else base_search.get("categories", {}).get(key)
+        if not old:
+            continue
+        check_time(f"search {key} time [s]", new["time"], old["time"])
+        if old["nps"] and new["nps"] < old["nps"] * (1 - threshold):
+            regressions.append(f"search {key} nps: {old['nps']} -> {new['nps']} "
+                               f"({(new['nps'] / old['nps'] - 1) * 100:.0f}%)")
+        old_rate, new_rate = old.get("first_move_cutoff_rate"), new["first_move_cutoff_rate"]
+        if old_rate and new_rate < old_rate * (1 - threshold):
+            regressions.append(f"search {key} first-move cutoff rate: {old_rate} -> {new_rate}")
+    old_positions = {p["sfen"]: p for p in base_search.get("positions", [])}
+    for pos in result["search"]["positions"]:
+        old = old_positions.get(pos["sfen"])
+        if old and (old["nodes"] != pos["nodes"] or old["move"] != pos["move"]):
+            notes.append(f"{pos['category']} {pos['sfen']}: nodes {old['nodes']} -> {pos['nodes']}, "
+                         f"move {old['move']} -> {pos['move']}, first-move cutoff rate "
+                         f"{old.get('first_move_cutoff_rate')} -> {pos['first_move_cutoff_rate']}")
+    return regressions, notes
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="game_logic benchmark")
+    parser.add_argument("--depth", type=int, default=SEARCH_DEPTH, help="探索の深さ")
+    parser.add_argument("--repeat", type=int, default=REPEAT, help="基本操作を測る回数（最速の回を使う）")
+    parser.add_argument("--calls", type=int, default=CALLS, help="1回の計測で1局面あたり呼ぶ回数")
+    parser.add_argument("--search-repeat", type=int, default=SEARCH_REPEAT, help="局面ごとに探索する回数")
+    parser.add_argument("--out", help="結果の JSON を書き出すファイル")
+    parser.add_argument("--baseline", help="比べる基準の JSON")
+    parser.add_argument("--threshold", type=float, default=THRESHOLD, help="回帰とみなす悪化の割合")
+    parser.add_argument("--drop-pruning", action="store_true",
+                        help="打つ手の絞り込みを切った探索とも比べる（分岐数・深さごとのノード数）")
+    args = parser.parse_args(argv)
+
+    result = run(args.depth, args.repeat, args.calls, args.search_repeat, args.drop_pruning)
+    for name, value in result["micro_us"].items():
+        print(f"{name:28s} {value:10.2f} us")
+    search = result["search"]
+    for key, row in [("total", search["total"])] + list(search["categories"].items()):
+        print(f"search depth {search['depth']} {key:12s} {row['time']:8.3f} s  "
+              f"{row['nodes']:8d} nodes  {row['qnodes']:8d} qnodes  {row['nps']:7d} nps  "
+              f"first-move cutoffs {row['first_move_cutoff_rate'] * 100:.0f}%")
+    for key, on in result.get("drop_pruning", {}).get("on", {}).items():
+        off = result["drop_pruning"]["off"][key]
+        print(f"drop pruning {key:12s} branching {on['branching']:6.2f} (off {off['branching']:6.2f})  "
+              f"nodes/depth {on['nodes_per_depth']} (off {off['nodes_per_depth']})  "
+              f"pruned {on['drops_pruned']}")
+
+    if args.out:
+        with open(args.out, "w", encoding="utf-8") as f:
+            json.dump(result, f, ensure_ascii=False, indent=1)
+
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as f:
+            baseline = json.load(f)
+        regressions, notes = compare(result, baseline, args.threshold)
+        for note in notes:
+            print("CHANGED", note)
+        for line in regressions:
+            print("REGRESSION", line)
+        if regressions:
+            return 1
+        print(f"no regressions (threshold {args.threshold * 100:.0f}%)")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,252 @@
+"""df-pn（証明数・反証数による深さ優先探索）の詰将棋ソルバー。
+
+攻め方（手番側）は王手だけ、玉方は合法手すべてを読み、攻め方の手番では
+cshogi の1手詰め判定 (mate_move_in_1ply) で末端を即座に証明する。
+αβ探索とは別の専用ハッシュ表（局面ハッシュ → (phi, delta)）を持つので、
+通常探索の置換表を汚さない。打ち歩詰めは cshogi の指し手生成が除外している。
+
+df-pn は最初に見つかった証明を返すので、詰みが分かったあとで、より短い詰みがないかを
+深さを1手ずつ（攻め方の手数で）増やす全幅探索で確かめ、最短の手順を返す。
+
+phi / delta は手番側から見た値で、攻め方の局面では (証明数, 反証数)、
+玉方の局面では (反証数, 証明数)。局面の phi = 子の delta の最小値、
+delta = 子の phi の和になる。
+
+    python dfpn.py SFEN [制限時間(秒)]   # 詰み手順を USI で表示
+"""
+import sys
+import time
+
+import cshogi
+
+INF = 1 << 30
+MATE_MAX_PLY = 31          # これより長い手順は読まない（玉方の逃れとして扱う）
+MATE_MAX_NODES = 200000    # 1回の solve で展開する局面数の上限
+TIME_CHECK_INTERVAL = 1024  # 何局面ごとに制限時間を確認するか
+
+
+class DfPnSolver:
+    """df-pn で手番側の詰みを探す。solve() は詰み手順（cshogi の move のリスト）か None を返す。
+
+    手順は局面数・時間の上限内で確かめられた最短のもの（玉方は最も長く逃れる応手を選ぶ）。
+
+    解けたかどうかは result に入る: "mate"（詰み）/ "nomate"（不詰）/ "unknown"（打ち切り）。
+    """
+
+    def __init__(self, max_nodes=MATE_MAX_NODES, max_ply=MATE_MAX_PLY):
+        self.max_nodes = max_nodes
+        self.max_ply = max_ply
+        self.table = {}
+        self.nodes = 0
+        self.result = "unknown"
+        self._path = set()
+        self._deadline = None
+        self._aborted = False
+
+    def solve(self, board, time_limit=None):
+        """board（cshogi.Board）の手番側が玉方を詰ませる手順を探す。board は元の局面に戻して返す。"""
+        self.table = {}
+        self.nodes = 0
+        self._path = set()
+        self._aborted = False
+        self._deadline = None if time_limit is None else time.time() + time_limit
+
+        phi, delta = self._mid(board, True, INF, INF, 0)
+        if phi == 0:
+            moves = self._proof(board, True, 0, {}, set())
+            if moves:
+                self.result = "mate"
+                return self._shorten(board, moves)
+        self.result = "nomate" if delta == 0 and not self._aborted else "unknown"
+        return None
+
+    def _initial(self, board, or_node):
+        """未展開の子局面の (phi, delta)。攻め方の局面は1手詰めならその場で証明する。"""
+        if or_node and not board.is_check() and board.mate_move_in_1ply():
+            return 0, INF
+        return 1, 1
+
+    def _mid(self, board, or_node, thphi, thdelta, ply):
+        """閾値 (thphi, thdelta) のどちらかを超えるまで読み、この局面の (phi, delta) を返す。"""
+        key = board.zobrist_hash()
+        self.nodes += 1
+        if self.nodes % TIME_CHECK_INTERVAL == 0 and self._deadline is not None \
+                and time.time() >= self._deadline:
+            self._aborted = True
+        if self.nodes >= self.max_nodes:
+            self._aborted = True
+
+        moves = list(board.check_moves if or_node else board.legal_moves)
+        if not moves:
+            # 王手がない攻め方・逃げ場のない玉方は、どちらも手番側の負け
+            self.table[key] = (INF, 0)
+            return INF, 0
+        if ply >= self.max_ply:
+            # 手数切れは詰まなかったものとして扱う
+            result = (INF, 0) if or_node else (0, INF)
+            self.table[key] = result
+            return result
+
+        self._path.add(key)
+        children = []
+        values = []
+        for move in moves:
+            board.push(move)
+            child_key = board.zobrist_hash()
+            if child_key in self._path:
+                # 同一手順中の局面に戻る手は千日手（連続王手）なので攻め方の失敗
+                value = (0, INF) if or_node else (INF, 0)
+            else:
+                value = self.table.get(child_key) or self._initial(board, not or_node)
+            board.pop()
+            children.append(move)
+            values.append(value)
+
+        while True:
+            phi = INF
+            delta = 0
+            best = -1
+            second = INF
+            for i, (child_phi, child_delta) in enumerate(values):
+                if child_delta < phi:
+                    second = phi
+                    phi = child_delta
+                    best = i
+                elif child_delta < second:
+                    second = child_delta
+                delta = min(INF, delta + child_phi)
+            if phi >= thphi or delta >= thdelta or self._aborted:
+                break
+            best_phi = values[best][0]
+            board.push(children[best])
+            values[best] = self._mid(board, not or_node, thdelta - delta + best_phi,
+                                     min(thphi, second + 1), ply + 1)
+            board.pop()
+
+        self._path.discard(key)
+        self.table[key] = (phi, delta)
+        return phi, delta
+
+    def _proven(self, board, or_node):
+        """子局面が攻め方の勝ちと証明済みか（ハッシュ表か1手詰め判定で確かめる）"""
+        entry = self.table.get(board.zobrist_hash())
+        if entry is not None:
+            # 攻め方の局面なら phi（証明数）、玉方の局面なら delta（証明数）が 0
+            return entry[0] == 0 if or_node else entry[1] == 0
+        return or_node and not board.is_check() and bool(board.mate_move_in_1ply())
+
+    def _shorten(self, board, moves):
+        """moves より短い詰みを、手数の上限を2手ずつ増やして探す。局面数か時間が尽きたら moves を返す。"""
+        memo = {}
+        for limit in range(1, len(moves), 2):
+            line = self._mate_within(board, True, limit, memo)
+            if self._aborted:
+                break
+            if line is not None:
+                return line
+        return moves
+
+    def _mate_within(self, board, or_node, limit, memo):
+        """limit 手以内の詰み手順（攻め方は最初に見つけた手、玉方は最も長く逃れる応手）か None。"""
+        key = (board.zobrist_hash(), or_node, limit)
+        if key in memo:
+            return memo[key]
+        self.nodes += 1
+        if self.nodes >= self.max_nodes or (self.nodes % TIME_CHECK_INTERVAL == 0 and self._deadline is not None
+                                            and time.time() >= self._deadline):
+            self._aborted = True
+        if self._aborted:
+            return None
+
+        best = None
+        if or_node:
+            if limit >= 1 and not board.is_check():
+                mate = board.mate_move_in_1ply()
+                if mate:
+                    best = [mate]
+            # mate_move_in_1ply は取りこぼす形があるので、王手を1手ずつ指しても確かめる
+            if best is None and limit >= 1:
+                for move in board.check_moves:
+                    board.push(move)
+                    line = self._mate_within(board, False, limit - 1, memo)
+                    board.pop()
+                    if line is not None:
+                        best = [move] + line
+                        break
+        else:
+            moves = list(board.legal_moves)
+            if not moves:
+                best = []
+            elif limit >= 2:
+                best = []
+                for move in moves:
+                    board.push(move)
+                    line = self._mate_within(board, True, limit - 1, memo)
+                    board.pop()
+                    if line is None:
+                        best = None
+                        break
+                    if not best or len(line) + 1 > len(best):
+                        best = [move] + line
+        if not self._aborted:
+            memo[key] = best
+        return best
+
+    def _proof(self, board, or_node, ply, memo, path):
+        """証明済みの局面から詰み手順を取り出す。攻め方は最短、玉方は最長の手順を選ぶ。"""
+        key = board.zobrist_hash()
+        if key in memo:
+            return memo[key]
+        if key in path or ply > self.max_ply:
+            return None
+
+        if or_node and not board.is_check():
+            mate = board.mate_move_in_1ply()
+            if mate:
+                memo[key] = [mate]
+                return memo[key]
+
+        path.add(key)
+        best = None
+        moves = list(board.check_moves if or_node else board.legal_moves)
+        if not moves and not or_node:
+            best = []
+        for move in moves:
+            board.push(move)
+            line = None
+            if self._proven(board, not or_node):
+                line = self._proof(board, not or_node, ply + 1, memo, path)
+            board.pop()
+            if or_node:
+                if line is not None and (best is None or len(line) + 1 < len(best)):
+                    best = [move] + line
+            else:
+                if line is None:
+                    best = None
+                    break
+                if best is None or len(line) + 1 > len(best):
+                    best = [move] + line
+        path.discard(key)
+        memo[key] = best
+        return best
+
+
+def solve_mate(sfen, time_limit=None, max_nodes=MATE_MAX_NODES):
+    """SFEN の手番側の詰みを探し、(詰み手順の USI のリスト or None, ソルバー) を返す。"""
+    board = cshogi.Board(sfen)
+    solver = DfPnSolver(max_nodes=max_nodes)
+    moves = solver.solve(board, time_limit=time_limit)
+    return (None if moves is None else [cshogi.move_to_usi(m) for m in moves]), solver
+
+
+if __name__ == "__main__":
+    if len(sys.argv) < 2:
+        print(__doc__)
+        sys.exit(1)
+    limit = float(sys.argv[2]) if len(sys.argv) > 2 else None
+    start = time.perf_counter()
+    usi_moves, mate_solver = solve_mate(sys.argv[1], time_limit=limit)
+    elapsed = time.perf_counter() - start
+    print(f"{mate_solver.result} nodes={mate_solver.nodes} time={elapsed:.2f}s")
+    if usi_moves:
+        print(" ".join(usi_moves))
@@ -1,16 +1,117 @@
 import copy
 import logging
+import os
 import random
 import time
 
 import cshogi
 
+from dfpn import DfPnSolver
+from opening_book import get_opening_book
+
 logger = logging.getLogger("shogi")
 
 # === 設定 ===
-CPU_DEPTH = 5           # 最大探索深度（iterative_deepeningが時間制限内で実効深度を決める）
+CPU_DEPTH = 64          # 反復深化の深さの安全上限。実際に読む深さは時間（またはノード数）の予算で決まる
 CPU_TIME_LIMIT = 30     # 制限時間（秒）- 反復深化で時間内に最大限深く読む
 QUIESCENCE_DEPTH = 4    # 静止探索の最大深度
+TT_SIZE_BITS = 18       # 置換表のスロット数 (2^18)。1エントリ数百バイト程度なので512MB制限に十分収まる
+SMP_WORKERS = 1         # 並列探索 (Lazy SMP) のプロセス数。1 なら従来どおり単一プロセスで探索
+
+HASH_MOVE_SCORE = 1000000  # 置換表の最善手の順序付けスコア（駒取り・成りより常に上）
+ASPIRATION_WINDOW = 300    # 反復深化で前回の評価値を中心に張る探索窓の半幅（外れたら4倍ずつ広げる）
+PVS_NULL_WINDOW = 1        # PVS で2手目以降を調べる null window の幅
+HISTORY_MAX = 2000         # 静かな手の history の上限。超えたら表全体を半分にして古い傾向を薄める
+
+# === 時間管理 ===
+# 制限時間はハードリミット（超えたら探索を打ち切る）。次の深さは、経過時間がソフトリミット
+# 未満で、分岐数とノード速度から予測した所要時間がハードリミットに収まるときだけ読み始める。
+TIME_SOFT_RATIO = 0.4         # ソフトリミット = 制限時間 × この割合
+TIME_STABLE_ITERATIONS = 3    # 最善手がこの回数の反復で続けて同じならソフトリミットを半分にする
+TIME_SCORE_DROP = 150         # 前の反復より評価値がこれ以上下がったらソフトリミットを延ばす
+TIME_EXTEND_FACTOR = 2.0      # 延ばすときの倍率（ハードリミットが上限）
+TIME_MIN_BRANCHING = 2.0      # 次の反復のノード数を予測するときの分岐数の下限
+TIME_DEFAULT_BRANCHING = 6.0  # 反復が1回しかないときに使う分岐数
+
+# === 難易度 ===
+# レベルごとの探索ノード数の上限（詰み探索の局面数を含む）。ノード数で打ち切る探索は時計に左右されないので、
+# 同じ局面・同じシードなら常に同じ手を返す。表にないレベル（最強）は時間で打ち切る。
+# bench.py の局面集での到達深さはおよそ 1: 0〜2 / 2: 1〜4 / 3: 3〜5 / 4: 4〜6、
+# 最強（CPU_TIME_LIMIT）は 5〜11 で、レベルごとに読みの深さがはっきり変わる。
+DIFFICULTY_NODE_LIMITS = {1: 200, 2: 1000, 3: 5000, 4: 30000}
+MAX_DIFFICULTY = 5
+
+# === 選択的探索（個別に False にして、到達深さ・強さへの効果を比べられる） ===
+USE_NULL_MOVE = True       # ヌルムーブ枝刈り（王手中・PV ノードでは使わない）
+NULL_MOVE_MIN_DEPTH = 3
+NULL_MOVE_REDUCTION = 2
+USE_LMR = True             # 後半の静かな手の深さを減らす (Late Move Reductions)
+LMR_MIN_DEPTH = 3
+LMR_FULL_MOVES = 4         # 最初の何手は減らさずに読むか
+LMR_DEEP_MOVES = 12        # これ以降の手は2手減らす
+USE_FUTILITY = True        # 末端付近で静的評価 + マージンが alpha に届かない静かな手を読まない
+FUTILITY_MARGINS = (0, 400, 800)  # 残り深さ 1, 2 のマージン
+USE_RAZORING = True        # 末端付近で静的評価が大きく足りないときは静止探索で確かめて打ち切る
+RAZOR_DEPTH = 2
+RAZOR_MARGIN = 600         # 残り深さ1あたりのマージン
+
+# === 打つ手の絞り込み ===
+# PV 以外のノードでは、玉の近く・敵駒の隣・利きのある自駒の隣への打ちだけを読む
+# （ルート・PV ノード・王手中は全ての打ちを読む）
+USE_DROP_PRUNING = True
+DROP_KING_RADIUS = 2       # 双方の玉からこの距離（縦横斜めの最大）以内のマスは常に候補
+
+# === 静止探索の枝刈り ===
+USE_SEE = True             # 静的交換評価 (SEE) で損な駒取りを静止探索から外し、通常探索では後回しにする
+USE_DELTA_PRUNING = True   # stand pat + 取る駒の価値でも窓に届かない駒取りを読まない
+DELTA_MARGIN = 200         # 位置評価・玉の安全度の変化分の余裕
+
+# === 遅延評価 ===
+# 静止探索の stand pat は、駒価値+位置評価+持ち駒に「直前に計算した玉周辺の項」を足した
+# 見積もりが窓からマージン以上外れていれば、玉周辺の項を計算せずに済ませる。
+# マージンは実際に計算した玉周辺の項と見積もりとのずれを集め、その分位点に合わせて自動調整する
+USE_LAZY_EVAL = True
+LAZY_EVAL_MARGIN = 1000      # 調整前の初期マージン
+LAZY_EVAL_QUANTILE = 0.99    # 観測したずれのこの割合を覆うマージンにする
+LAZY_EVAL_SAMPLES = 512      # この回数だけ玉周辺の項を計算するごとにマージンを調整し直す
+LAZY_EVAL_MIN_MARGIN = 200   # 調整後のマージンの下限
+
+# === 囲いハッシュ ===
+# 玉周辺の守り駒・端玉・歩の防壁の項は、自分の歩の配置・玉の位置・玉周辺3x3の駒でほぼ決まり、
+# 兄弟ノード間ではめったに変わらないので、専用の小さなハッシュ表に覚えておく
+SHELTER_TABLE_BITS = 12    # 囲いハッシュのスロット数 (2^12)
+
+# === 評価値キャッシュ ===
+# 反復深化の各反復・深さ0の葉と静止探索の stand pat・合流局面で同じ局面を何度も評価するので、
+# 局面の Zobrist ハッシュ -> 静的評価値 を固定サイズの表に覚えておく（衝突したら上書き）
+USE_EVAL_CACHE = True
+EVAL_CACHE_BITS = 16       # スロット数 (2^16)。1スロットあたりキーと評価値で 50 バイト程度
+
+# === 千日手 ===
+# 探索経路上か対局の過去に同じ局面があれば千日手として打ち切る（連続王手の千日手は王手をかけ続けた側の負け）
+USE_REPETITION = True
+DRAW_SCORE = 0
+PERPETUAL_CHECK_SCORE = 50000  # 連続王手の千日手の評価値（詰みとみなす 90000 より小さくする）
+
+# === 定跡 ===
+# opening_book.py で作った定跡ファイルに局面があれば、探索せずに定跡手を返す。
+# ファイルがなければ定跡なしで探索する。
+USE_OPENING_BOOK = True
+OPENING_BOOK_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "opening_book.bin")
+
+# === 詰み探索 (df-pn) ===
+# 反復深化の前に、手番側の詰みだけを df-pn（dfpn.py）で短時間探す。
+# 詰めばαβ探索をせずに詰み手順の初手を返す。
+USE_MATE_SEARCH = True
+MATE_SEARCH_TIME_RATIO = 0.05  # 制限時間のうち詰み探索に使う割合
+MATE_SEARCH_MAX_TIME = 1.0     # 詰み探索の時間の上限（秒）
+MATE_SEARCH_NODES = 50000      # 詰み探索の局面数の上限（固定深さの探索でも打ち切れるように）
+MATE_SEARCH_NODE_RATIO = 0.1   # ノード数で打ち切る探索で、node_limit のうち詰み探索に回す割合
+
+# 置換表のバウンド種別
+TT_EXACT = 0   # 窓内で確定した評価値
+TT_LOWER = 1   # beta カット（真の値 >= score）
+TT_UPPER = 2   # alpha 以下（真の値 <= score）
 
 # 定数定義
 BOARD_SIZE = 9
@@ -128,6 +229,46 @@ PST_MAP = {
     "馬": PST_BISHOP, "竜": PST_ROOK,
 }
 
+# 玉周辺（3x3）の味方駒ボーナス
+KING_DEFENDER_VALUES = {"金": 250, "銀": 200, "全": 200, "と": 180,
+                        "杏": 150, "圭": 150, "馬": 120, "竜": 120,
+                        "歩": 60, "香": 80, "桂": 40}
+
+# 大駒が敵陣に侵入しているときのペナルティ（侵入された側から見て）
+INVASION_PENALTY = {"飛": 600, "竜": 900, "角": 400, "馬": 700}
+
+
+def _piece_square_score(name, owner, x, y):
+    """1駒の 駒価値 + 位置評価 + 大駒侵入ペナルティ（後手有利を正とする）。
+
+    盤上の駒の配置だけで決まる項なので、差分評価ではこの値を加減算する。
+    """
+    val = PIECE_VALUES.get(name, 0)
+    pst = PST_MAP.get(name)
+    pos_bonus = 0
+    if pst:
+        pos_bonus = pst[y][x] if owner == SENTE else pst[8 - y][8 - x]
+    score = (val + pos_bonus) if owner == GOTE else -(val + pos_bonus)
+
+    penalty = INVASION_PENALTY.get(name)
+    if penalty:
+        if owner == SENTE and y <= 2:
+            score -= penalty + (2 - y) * 100
+        elif owner == GOTE and y >= 6:
+            score += penalty + (y - 6) * 100
+    return score
+
+
+# PSQ_SCORES[owner][name][y * 9 + x]
+PSQ_SCORES = {
+    owner: {name: [_piece_square_score(name, owner, i % 9, i // 9) for i in range(81)]
+            for name in PIECE_VALUES}
+    for owner in (SENTE, GOTE)
+}
+
+# 終盤判定用の駒の総価値（玉は数えない）
+MATERIAL_VALUES = {name: (0 if name == "王" else val) for name, val in PIECE_VALUES.items()}
+
 # 成駒のマッピング (成駒 -> 元駒)
 UNPROMOTION_MAP = {
     "と": "歩", "杏": "香", "圭": "桂", "全": "銀", "馬": "角", "竜": "飛"
@@ -138,6 +279,22 @@ SFEN_CHAR_TO_KANJI = {v: k for k, v in SFEN_MAP.items()}
 USI_FILES = "987654321"
 USI_RANKS = "abcdefghi"
 
+# 探索統計で全反復の合計をとるカウンタ（ShogiGame の属性名から先頭の _ を除いたもの）と、
+# 囲いハッシュ・評価値キャッシュのヒット数・参照数
+STAT_TOTAL_KEYS = ("nodes_searched", "qnodes", "cutoffs", "first_move_cutoffs", "moves_searched",
+                   "expanded_nodes", "tt_probes", "tt_hits", "lazy_evals", "lazy_skips", "drops_pruned")
+STAT_CACHE_KEYS = ("shelter_hits", "shelter_probes", "eval_cache_hits", "eval_cache_probes",
+                   "eval_cache_misses", "eval_cache_evictions")
+
+# === cshogi 整数表現との対応 ===
+# cshogi の駒種 (PAWN=1 ... PROM_ROOK=14) -> 駒名
+CSHOGI_PIECE_TYPE_NAMES = [None, "歩", "香", "桂", "銀", "角", "飛", "金", "王",
+                           "と", "杏", "圭", "全", "馬", "竜"]
+# cshogi の持ち駒種 (HPAWN=0 ... HROOK=6) -> 駒名
+CSHOGI_HAND_PIECE_NAMES = ["歩", "香", "桂", "銀", "金", "角", "飛"]
+# cshogi のマス番号 (筋*9+段, 1筋=0) -> 内部座標 (x, y)
+SQ_TO_XY = [(8 - sq // 9, sq % 9) for sq in range(81)]
+
 
 def parse_usi_string(usi):
     """USI文字列を内部の move dict に変換する。
@@ -162,6 +319,15 @@ def parse_usi_string(usi):
     return {'type': 'move', 'from': [sx, sy], 'to': [tx, ty], 'promote': promote}
 
 
+def move_to_dict(move):
+    """cshogi の整数 move を内部 move dict に変換する（API 境界用）。"""
+    d = parse_usi_string(cshogi.move_to_usi(move))
+    d["to"] = tuple(d["to"])
+    if d["type"] == "move":
+        d["from"] = tuple(d["from"])
+    return d
+
+
 def to_usi(move):
     """内部 move dict を USI 文字列に変換する。"""
     if move["type"] == "drop":
@@ -207,23 +373,398 @@ for name, data in PIECES.items():
     if "promote" not in PIECES[name]:
         PIECES[name]["promote"] = None
 
+def _oriented(vectors, owner):
+    forward = 1 if owner == SENTE else -1
+    return frozenset((mx * forward, my * forward) for mx, my in vectors)
+
+
+# 利きの逆引き用テーブル: 駒から見た (dx, dy) で、一歩で届く方向 / 走り駒として届く方向
+ATTACK_STEPS = {owner: {} for owner in (SENTE, GOTE)}
+ATTACK_SLIDES = {owner: {} for owner in (SENTE, GOTE)}
+for owner in (SENTE, GOTE):
+    for name, data in PIECES.items():
+        extra = data.get("extra_moves", [])
+        if data["type"] == "slide":
+            ATTACK_STEPS[owner][name] = _oriented(extra, owner)
+            ATTACK_SLIDES[owner][name] = _oriented(data["moves"], owner)
+        else:
+            ATTACK_STEPS[owner][name] = _oriented(data["moves"], owner)
+            ATTACK_SLIDES[owner][name] = frozenset()
+KNIGHT_STEPS = {owner: tuple(_oriented(PIECES["桂"]["moves"], owner)) for owner in (SENTE, GOTE)}
+RAY_DIRECTIONS = ((-1, -1), (0, -1), (1, -1), (-1, 0), (1, 0), (-1, 1), (0, 1), (1, 1))
+
+# cshogi の駒種 -> 駒の価値 / 成ったときの価値の増分（手の順序付け用）
+PIECE_TYPE_VALUES = [PIECE_VALUES[n] if n else 0 for n in CSHOGI_PIECE_TYPE_NAMES]
+PROMOTION_GAINS = [
+    PIECE_VALUES[PIECES[n]["promote"]] - PIECE_VALUES[n] if n and PIECES[n]["promote"] else 0
+    for n in CSHOGI_PIECE_TYPE_NAMES
+]
+# cshogi の駒種 -> その駒を取ったときの評価値の増分の上限（デルタ枝刈り用）
+# 盤上の駒価値 + 持ち駒としての価値（終盤倍率）+ 侵入していた大駒のペナルティ解消分
+CAPTURE_GAINS = [
+    PIECE_VALUES[n] + PIECE_VALUES[UNPROMOTION_MAP.get(n, n)] * 1.6 + INVASION_PENALTY.get(n, 0) + 200
+    if n and n != "王" else 0
+    for n in CSHOGI_PIECE_TYPE_NAMES
+]
+
+# === コンパクト盤面表現 ===
+# 盤面は 81 要素の bytearray（添字 y * 9 + x）。駒コードは cshogi と同じ
+# 「色(先手0/後手1) * 16 + 駒種」で、0 は空きマス。持ち駒は色ごとの
+# 7 要素リスト（cshogi の HPAWN..HROOK 順）。
+PROMOTED_BIT = 8
+KING_TYPE = cshogi.KING
+PAWN_TYPE = cshogi.PAWN
+MAX_PLY = 256  # 探索中の undo スタックの深さ
+
+CODE_NAMES = [None] * 32
+CODE_OWNERS = [0] * 32
+PIECE_CODES = {}
+for _type, _name in enumerate(CSHOGI_PIECE_TYPE_NAMES):
+    if _name:
+        for _owner, _color in ((SENTE, 0), (GOTE, 1)):
+            _code = _color * 16 + _type
+            CODE_NAMES[_code] = _name
+            CODE_OWNERS[_code] = _owner
+            PIECE_CODES[(_name, _owner)] = _code
+
+HAND_INDEX = {name: i for i, name in enumerate(CSHOGI_HAND_PIECE_NAMES)}
+SFEN_HAND_ORDER = [HAND_INDEX[name] for name in ("飛", "角", "金", "銀", "桂", "香", "歩")]
+HAND_VALUES = [PIECE_VALUES[name] for name in CSHOGI_HAND_PIECE_NAMES]
+# [色][持ち駒種] -> 打ったときの駒コード
+HAND_TO_CODE = [[PIECE_CODES[(name, owner)] for name in CSHOGI_HAND_PIECE_NAMES] for owner in (SENTE, GOTE)]
+# 駒コード -> 取ったときの持ち駒種（玉・空きは -1）
+CODE_TO_HAND = [HAND_INDEX.get(UNPROMOTION_MAP.get(n, n), -1) if n else -1 for n in CODE_NAMES]
+# 駒コード -> 成った駒コード（成れない駒はそのまま）
+PROMOTED_CODE = [c | PROMOTED_BIT if CODE_NAMES[c] and PIECES[CODE_NAMES[c]]["promote"] else c
+                 for c in range(32)]
+
+# 駒コード別の評価テーブル
+PSQ_BY_CODE = [PSQ_SCORES[CODE_OWNERS[c]][CODE_NAMES[c]] if CODE_NAMES[c] else None for c in range(32)]
+MATERIAL_BY_CODE = [MATERIAL_VALUES[n] if n else 0 for n in CODE_NAMES]
+DEFENDER_BY_CODE = [KING_DEFENDER_VALUES.get(n, 50) if n else 0 for n in CODE_NAMES]
+STEPS_BY_CODE = [ATTACK_STEPS[CODE_OWNERS[c]][CODE_NAMES[c]] if CODE_NAMES[c] else frozenset()
+                 for c in range(32)]
+SLIDES_BY_CODE = [ATTACK_SLIDES[CODE_OWNERS[c]][CODE_NAMES[c]] if CODE_NAMES[c] else frozenset()
+                  for c in range(32)]
+
+# cshogi のマス番号 -> 盤面添字
+SQ_TO_INDEX = [y * 9 + x for x, y in SQ_TO_XY]
+# 盤面添字 -> 周囲8マスの添字（盤外は除く）
+KING_NEIGHBORS = [
+    tuple((i // 9 + dy) * 9 + (i % 9 + dx) for dx, dy in RAY_DIRECTIONS
+          if 0 <= i % 9 + dx < BOARD_SIZE and 0 <= i // 9 + dy < BOARD_SIZE)
+    for i in range(81)
+]
+# 盤面添字 -> 距離 DROP_KING_RADIUS 以内のマスの添字（自分自身を含む）
+KING_ZONES = [
+    tuple(y * 9 + x
+          for y in range(max(0, i // 9 - DROP_KING_RADIUS), min(BOARD_SIZE, i // 9 + DROP_KING_RADIUS + 1))
+          for x in range(max(0, i % 9 - DROP_KING_RADIUS), min(BOARD_SIZE, i % 9 + DROP_KING_RADIUS + 1)))
+    for i in range(81)
+]
+
+
+# === 利きテーブル（import 時に一度だけ作る） ===
+def _piece_vectors(name, owner):
+    """(一歩・桂跳びで行ける方向, 走る方向) を PIECES の順で、owner の向きに合わせて返す。"""
+    data = PIECES[name]
+    forward = 1 if owner == SENTE else -1
+    if data["type"] == "slide":
+        steps, slides = data.get("extra_moves", []), data["moves"]
+    else:
+        steps, slides = data["moves"], []
+    return ([(mx * forward, my * forward) for mx, my in steps],
+            [(mx * forward, my * forward) for mx, my in slides])
+
+
+def _ray(i, dx, dy):
+    """添字 i から (dx, dy) 方向に盤端までのマスの添字を近い順に並べたタプル"""
+    x, y = i % 9 + dx, i // 9 + dy
+    squares = []
+    while 0 <= x < BOARD_SIZE and 0 <= y < BOARD_SIZE:
+        squares.append(y * 9 + x)
+        x += dx
+        y += dy
+    return tuple(squares)
+
+
+# PIECE_STEPS[駒コード][添字]: 一歩（桂は跳び、馬・竜は追加の一歩）で行けるマス
+# PIECE_RAYS[駒コード][添字]: 走る方向ごとの盤端までのマス（近い順）
+# PIECE_REACH[駒コード][添字]: {行けるマス: 途中で空いている必要があるマス}（駒がない盤面での到達範囲）
+PIECE_STEPS = [[()] * 81 for _ in range(32)]
+PIECE_RAYS = [[()] * 81 for _ in range(32)]
+PIECE_REACH = [[{}] * 81 for _ in range(32)]
+for _code in range(32):
+    if not CODE_NAMES[_code]:
+        continue
+    _steps, _slides = _piece_vectors(CODE_NAMES[_code], CODE_OWNERS[_code])
+    for _i in range(81):
+        PIECE_STEPS[_code][_i] = tuple(
+            (_i // 9 + dy) * 9 + _i % 9 + dx for dx, dy in _steps
+            if 0 <= _i % 9 + dx < BOARD_SIZE and 0 <= _i // 9 + dy < BOARD_SIZE)
+        PIECE_RAYS[_code][_i] = tuple(r for r in (_ray(_i, dx, dy) for dx, dy in _slides) if r)
+        _reach = {to: () for to in PIECE_STEPS[_code][_i]}
+        for _r in PIECE_RAYS[_code][_i]:
+            for _n, _to in enumerate(_r):
+                _reach.setdefault(_to, _r[:_n])
+        PIECE_REACH[_code][_i] = _reach
+
+# 利きの逆引き（is_square_attacked 用）
+# SQUARE_RAYS[添字]: RAY_DIRECTIONS の方向番号 d ごとに (d, 隣のマス, その先のマス) 。盤外の方向は含めない
+# ADJACENT_ATTACK_MASKS[駒コード]: 方向 d の隣にいるとき、こちらに利いていれば bit d が立つ
+# SLIDE_ATTACK_MASKS[駒コード]: 方向 d の2マス以上先（間は空き）にいるとき、こちらに利いていれば bit d
+# KNIGHT_SOURCES[色][添字]: その色の桂がいればこのマスに利くマス
+SQUARE_RAYS = [
+    tuple((d, r[0], r[1:]) for d, r in ((d, _ray(i, dx, dy)) for d, (dx, dy) in enumerate(RAY_DIRECTIONS)) if r)
+    for i in range(81)
+]
+SLIDE_ATTACK_MASKS = [sum(1 << d for d, (dx, dy) in enumerate(RAY_DIRECTIONS) if (-dx, -dy) in SLIDES_BY_CODE[c])
+                      for c in range(32)]
+ADJACENT_ATTACK_MASKS = [
+    SLIDE_ATTACK_MASKS[c] | sum(1 << d for d, (dx, dy) in enumerate(RAY_DIRECTIONS) if (-dx, -dy) in STEPS_BY_CODE[c])
+    for c in range(32)
+]
+KNIGHT_SOURCES = [
+    [tuple((i // 9 - dy) * 9 + i % 9 - dx for dx, dy in KNIGHT_STEPS[owner]
+           if 0 <= i % 9 - dx < BOARD_SIZE and 0 <= i // 9 - dy < BOARD_SIZE)
+     for i in range(81)]
+    for owner in (SENTE, GOTE)
+]
+
+# 盤面添字 -> 玉周辺3x3 の各行の (start, stop) を3行分（盤外の行は空の範囲）。囲いハッシュのキー用
+SHELTER_ROWS = [
+    tuple(v for y in (i // 9 - 1, i // 9, i // 9 + 1)
+          for v in ((y * 9 + max(0, i % 9 - 1), y * 9 + min(BOARD_SIZE - 1, i % 9 + 1) + 1)
+                    if 0 <= y < BOARD_SIZE else (0, 0)))
+    for i in range(81)
+]
+# 囲いハッシュのキー: 色ごとの歩の配置の Zobrist キー（差分更新）と玉の位置のキー
+_zobrist_rng = random.Random(0x5107)
+PAWN_KEYS = [[_zobrist_rng.getrandbits(64) for _ in range(81)] for _ in range(2)]
+KING_SQ_KEYS = [[_zobrist_rng.getrandbits(64) for _ in range(81)] for _ in range(2)]
+
+
+# cshogi の整数 move のビット配置（手の順序付けは手の数だけ呼ばれるので、アクセサ関数ではなく直接読む）
+# 移動先 bit 0-6 / 移動元 bit 7-13（打ちは 80 + 駒種）/ 成り bit 14 / 動かす駒種 bit 16-19 / 取る駒種 bit 20-23
+MOVE_SQ_MASK = 0x7F
+MOVE_FROM_SHIFT = 7
+MOVE_PROMOTE_BIT = 1 << 14
+MOVE_PIECE_SHIFT = 16
+MOVE_CAPTURE_SHIFT = 20
+
+# history / counter-move テーブルの添字: (手番, 動かす駒, 移動先)
+# 駒は cshogi の駒種 1..14、打ちは駒種ごとに 15..21 として区別する
+HISTORY_PIECES = 22
+HISTORY_SIZE = 2 * HISTORY_PIECES * 81
+
+
+def _history_index(move, color):
+    piece = (move >> MOVE_PIECE_SHIFT) & 15 or ((move >> MOVE_FROM_SHIFT) & MOVE_SQ_MASK) - 66
+    return (color * HISTORY_PIECES + piece) * 81 + (move & MOVE_SQ_MASK)
+
+
+def _piece_dict(code):
+    """駒コードを従来の {"name", "owner"} 形式に変換する（空きマスは None）。"""
+    if not code:
+        return None
+    return {"name": CODE_NAMES[code], "owner": CODE_OWNERS[code]}
+
+
+class TranspositionTable:
+    """Zobrist ハッシュをキーとする固定サイズの置換表。
+
+    スロットは 2^size_bits 個で、ハッシュ下位ビットでインデックスする。
+    置換方針: 空き / 同一局面 / 前回探索の古いエントリ / 深さが同等以上 なら上書き。
+    """
+
+    def __init__(self, size_bits=TT_SIZE_BITS):
+        self.mask = (1 << size_bits) - 1
+        self.entries = [None] * (1 << size_bits)
+        self.generation = 0
+
+    def new_search(self):
+        """探索開始ごとに世代を進め、古いエントリを優先的に置換させる。"""
+        self.generation = (self.generation + 1) & 0xFF
+
+    def probe(self, key):
+        """(depth, bound, score, move) を返す。未登録なら None。"""
+        entry = self.entries[key & self.mask]
+        if entry is not None and entry[0] == key:
+            return entry[1], entry[2], entry[3], entry[4]
+        return None
+
+    def store(self, key, depth, bound, score, move):
+        idx = key & self.mask
+        old = self.entries[idx]
+        if old is None or old[0] == key or old[5] != self.generation or depth >= old[1]:
+            self.entries[idx] = (key, depth, bound, score, move, self.generation)
+
+
+class ShelterTable:
+    """玉の囲いの評価（守り駒・空きマス・端玉・歩の防壁）を覚えておく固定サイズのハッシュ表。
+
+    キーは自分の歩の配置・玉の位置・玉周辺3x3の駒から作る。歩の防壁は玉周辺より先で
+    歩との間にあるマスの駒にも左右されるので、エントリにそのマスと駒を持たせて一致を確かめる。
+    hits / probes はヒット率の確認用。
+    """
+
+    def __init__(self, size_bits=SHELTER_TABLE_BITS):
+        self.mask = (1 << size_bits) - 1
+        self.entries = [None] * (1 << size_bits)
+        self.hits = 0
+        self.probes = 0
+
+    def probe(self, key, squares):
+        """覚えている評価値を返す。未登録・間のマスの駒が変わっていれば None。"""
+        self.probes += 1
+        entry = self.entries[key & self.mask]
+        if entry is not None and entry[0] == key and \
+                (not entry[2] or bytes(squares[i] for i in entry[2]) == entry[3]):
+            self.hits += 1
+            return entry[1]
+        return None
+
+    def store(self, key, score, extra, squares):
+        self.entries[key & self.mask] = (key, score, extra, bytes(squares[i] for i in extra))
+
+
+class EvalCache:
+    """局面の Zobrist ハッシュ -> 静的評価値 の固定サイズのキャッシュ。
+
+    スロットはハッシュ下位ビットでインデックスし、別の局面が来たら常に上書きする。
+    hits / misses / evictions は探索統計用。
+    """
+
+    def __init__(self, size_bits=EVAL_CACHE_BITS):
+        self.mask = (1 << size_bits) - 1
+        self.keys = [0] * (1 << size_bits)
+        self.scores = [0.0] * (1 << size_bits)
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def probe(self, key):
+        """覚えている評価値を返す。未登録なら None。"""
+        idx = key & self.mask
+        if self.keys[idx] == key:
+            self.hits += 1
+            return self.scores[idx]
+        self.misses += 1
+        return None
+
+    def store(self, key, score):
+        idx = key & self.mask
+        if self.keys[idx] and self.keys[idx] != key:
+            self.evictions += 1
+        self.keys[idx] = key
+        self.scores[idx] = score
+
+
 class ShogiGame:
     def __init__(self, vs_ai=False):
         self.vs_ai = vs_ai
         self.turn = SENTE
-        self.board = [[None for _ in range(BOARD_SIZE)] for _ in range(BOARD_SIZE)]
-        self.hands = {SENTE: {}, GOTE: {}}
+        self._squares = bytearray(81)
+        self._hands = [[0] * 7, [0] * 7]
         self.selected = None
         self.game_over = False
         self.move_count = 1
         self.last_move = None
         self._search_start_time = 0
         self._search_time_limit = CPU_TIME_LIMIT
+        self._search_deadline = 0
+        self._node_limit = None  # ノード数で打ち切る探索の上限（None なら時間だけで打ち切る）
+        self._node_budget = float('inf')  # 今の反復で読めるノード数の残り
         self._search_aborted = False
+        self._root_best = None  # 反復の途中で打ち切ったときに使う、読み終えたルートの手のうち最善の (評価値, 手)
         self._nodes_searched = 0
+        self._tt = None
+        self._eval_cache = None
+        self._opening_book = get_opening_book(OPENING_BOOK_PATH) if USE_OPENING_BOOK else None
+        # 手の並びの同点を崩す乱数と定跡手の選択に使う（iterative_deepening の seed で固定できる）
+        self._rng = random.Random()
+        self._stop_event = None  # Lazy SMP のヘルパーを止めるための multiprocessing.Event
+        # 三角 PV テーブル: _pv[ply] はその ply 以降の読み筋。前回の反復の読み筋は _prev_pv
+        self._pv = [[] for _ in range(MAX_PLY + 1)]
+        self._prev_pv = []
+        self._follow_pv = False
+        # 静かな手の順序付け: ply ごとのキラー手・history・カウンター手
+        self._killers = [[0, 0] for _ in range(MAX_PLY + 1)]
+        self._history = [0] * HISTORY_SIZE
+        self._counter_moves = [0] * HISTORY_SIZE
+        self._cutoffs = 0
+        self._first_move_cutoffs = 0
+        # 平均分岐数 = 読んだ手の数 / 手を読んだノード数、打ちの絞り込みで読まなかった手の数
+        self._moves_searched = 0
+        self._expanded_nodes = 0
+        self._drops_pruned = 0
+        # 遅延評価: 見積もりに使う直前の玉周辺の項・マージン・マージン調整用のずれの標本・
+        # stand pat の回数と玉周辺の項を省いた回数
+        self._lazy_positional = 0
+        self._lazy_margin = LAZY_EVAL_MARGIN
+        self._lazy_samples = []
+        self._lazy_evals = 0
+        self._lazy_skips = 0
+        self._shelter = ShelterTable()
+        # 探索統計: 静止探索のノード数・置換表の参照回数とヒット数、反復ごとの記録と全反復の合計。
+        # iterative_deepening の最後に search_stats（API 応答用の dict）にまとめる
+        self._qnodes = 0
+        self._tt_probes = 0
+        self._tt_hits = 0
+        self._mate_nodes = 0
+        self._iteration_stats = []
+        self._stat_totals = dict.fromkeys(STAT_TOTAL_KEYS + STAT_CACHE_KEYS, 0)
+        self.search_stats = None
+        # 探索用の undo スタック（手ごとの dict 生成を避けるため事前確保）
+        self._ply = 0
+        self._undo_moves = [0] * MAX_PLY
+        self._undo_captured = bytearray(MAX_PLY)
+        self._undo_psq = [0] * MAX_PLY
+        self._undo_material = [0] * MAX_PLY
+        # 千日手の検出用: ply ごとの局面ハッシュと王手の有無、局面ハッシュ -> 出現回数
+        # （対局の過去の局面 + 探索経路。_apply_move/_undo_move で増減する）
+        self._position_history = []
+        self._hash_stack = [0] * (MAX_PLY + 1)
+        self._check_stack = bytearray(MAX_PLY + 1)
+        self._repetitions = {}
         self.init_board()
         self._cb = cshogi.Board()
 
+    # === 従来形式の盤面・持ち駒ビュー（API / JSON 用） ===
+    @property
+    def board(self):
+        """9x9 の {"name", "owner"} 形式の盤面。参照のたびに作り直すので探索では使わない。"""
+        squares = self._squares
+        return [[_piece_dict(squares[y * 9 + x]) for x in range(BOARD_SIZE)] for y in range(BOARD_SIZE)]
+
+    @board.setter
+    def board(self, grid):
+        squares = bytearray(81)
+        for y, row in enumerate(grid):
+            for x, p in enumerate(row):
+                if p:
+                    squares[y * 9 + x] = PIECE_CODES[(p["name"], int(p["owner"]))]
+        self._squares = squares
+        self._reset_eval_state()
+
+    @property
+    def hands(self):
+        """{owner: {駒名: 枚数}} 形式の持ち駒（0枚の駒は含めない）。"""
+        return {
+            owner: {name: count for name, count in zip(CSHOGI_HAND_PIECE_NAMES, self._hands[color]) if count > 0}
+            for color, owner in ((0, SENTE), (1, GOTE))
+        }
+
+    @hands.setter
+    def hands(self, hands):
+        new_hands = [[0] * 7, [0] * 7]
+        for owner, pieces in hands.items():
+            color = 0 if int(owner) == SENTE else 1
+            for name, count in pieces.items():
+                new_hands[color][HAND_INDEX[UNPROMOTION_MAP.get(name, name)]] += count
+        self._hands = new_hands
+        self._reset_eval_state()
+
     def init_board(self):
         setup = [
             (0, 0, "香", GOTE), (1, 0, "桂", GOTE), (2, 0, "銀", GOTE), (3, 0, "金", GOTE), (4, 0, "王", GOTE), (5, 0, "金", GOTE), (6, 0, "銀", GOTE), (7, 0, "桂", GOTE), (8, 0, "香", GOTE),
@@ -233,12 +774,57 @@ class ShogiGame:
             (1, 7, "角", SENTE), (7, 7, "飛", SENTE),
             (0, 8, "香", SENTE), (1, 8, "桂", SENTE), (2, 8, "銀", SENTE), (3, 8, "金", SENTE), (4, 8, "王", SENTE), (5, 8, "金", SENTE), (6, 8, "銀", SENTE), (7, 8, "桂", SENTE), (8, 8, "香", SENTE),
         ]
+        squares = bytearray(81)
         for x, y, name, owner in setup:
-            self.board[y][x] = {"name": name, "owner": owner}
+            squares[y * 9 + x] = PIECE_CODES[(name, owner)]
+        self._squares = squares
+        self._reset_eval_state()
+
+    def _reset_eval_state(self):
+        """盤面全体から差分評価用の状態を再計算する。
+
+        駒価値+位置評価・総駒価値・持ち駒の価値・玉の位置・色ごとの歩の配置のキー・色ごとの駒リスト。
+        探索中は _apply_move/_undo_move が差分で更新するので、ここを通るのは
+        盤面を丸ごと差し替えたときだけ。
+        """
+        psq_score = 0
+        material = 0
+        king_sq = [None, None]
+        piece_list = [[], []]
+        piece_index = [0] * 81
+        pawn_keys = [0, 0]
+        for i, code in enumerate(self._squares):
+            if code:
+                color = code >> 4
+                if code & 15 == PAWN_TYPE:
+                    pawn_keys[color] ^= PAWN_KEYS[color][i]
+                psq_score += PSQ_BY_CODE[code][i]
+                material += MATERIAL_BY_CODE[code]
+                piece_index[i] = len(piece_list[color])
+                piece_list[color].append(i)
+                if code & 15 == KING_TYPE and king_sq[color] is None:
+                    king_sq[color] = i
+        hand_value = [sum(v * c for v, c in zip(HAND_VALUES, self._hands[color])) for color in (0, 1)]
+        self._psq_score = psq_score
+        self._material = material + hand_value[0] + hand_value[1]
+        self._hand_value = hand_value
+        self._king_sq = king_sq
+        self._pawn_keys = pawn_keys
+        self._piece_list = piece_list
+        self._piece_index = piece_index
+        self._ply = 0
+
+    def _piece_list_remove(self, color, i):
+        plist = self._piece_list[color]
+        last = plist.pop()
+        if last != i:
+            idx = self._piece_index[i]
+            plist[idx] = last
+            self._piece_index[last] = idx
 
     def get_piece(self, x, y):
         if 0 <= x < BOARD_SIZE and 0 <= y < BOARD_SIZE:
-            return self.board[y][x]
+            return _piece_dict(self._squares[y * 9 + x])
         return None
 
     def switch_turn(self):
@@ -247,60 +833,25 @@ class ShogiGame:
 
     def add_to_hand(self, owner, piece_name):
         name = UNPROMOTION_MAP.get(piece_name, piece_name)
-        self.hands[owner][name] = self.hands[owner].get(name, 0) + 1
+        self._hands[0 if owner == SENTE else 1][HAND_INDEX[name]] += 1
 
     def is_pseudo_valid_move(self, start, end, piece, owner):
+        """piece を start から end へ動かせる形か（駒の動き・途中の駒・自駒の有無だけを見る）。"""
         sx, sy = start
         ex, ey = end
-        dx, dy = ex - sx, ey - sy
-        forward = 1 if owner == SENTE else -1
-        
-        target = self.get_piece(ex, ey)
-        if target and target["owner"] == owner:
+        if not (0 <= sx < BOARD_SIZE and 0 <= sy < BOARD_SIZE and 0 <= ex < BOARD_SIZE and 0 <= ey < BOARD_SIZE):
             return False
-
-        piece_info = PIECES[piece["name"]]
-        move_type = piece_info["type"]
-        base_moves = piece_info["moves"]
-        extra_moves = piece_info.get("extra_moves", [])
-
-        valid_steps = []
-        for mx, my in base_moves:
-            valid_steps.append((mx * forward, my * forward))
-        for mx, my in extra_moves:
-             valid_steps.append((mx * forward, my * forward))
-
-        if move_type == "step" or (move_type == "slide" and (dx, dy) in valid_steps):
-             if (dx, dy) in valid_steps: return True
-
-        if move_type == "jump":
-             if (dx, dy) in valid_steps: return True
-        
-        if move_type == "slide":
-            direction = None
-            for mx, my in base_moves:
-                check_mx, check_my = mx * forward, my * forward
-                if check_mx == 0 and dx == 0: 
-                    if check_my * dy > 0: direction = (0, 1 if dy > 0 else -1)
-                elif check_my == 0 and dy == 0:
-                    if check_mx * dx > 0: direction = (1 if dx > 0 else -1, 0)
-                elif check_mx != 0 and check_my != 0 and abs(dx) == abs(dy):
-                     if (dx // abs(dx)) == check_mx and (dy // abs(dy)) == check_my:
-                         direction = (check_mx, check_my)
-            
-            if direction:
-                curr_x, curr_y = sx + direction[0], sy + direction[1]
-                steps = 0
-                while (curr_x, curr_y) != (ex, ey):
-                    steps += 1
-                    if steps > BOARD_SIZE: return False
-                    if not (0 <= curr_x < BOARD_SIZE and 0 <= curr_y < BOARD_SIZE): return False
-                    if self.get_piece(curr_x, curr_y) is not None:
-                        return False
-                    curr_x += direction[0]
-                    curr_y += direction[1]
-                return True
-        return False
+        squares = self._squares
+        target = squares[ey * 9 + ex]
+        if target and CODE_OWNERS[target] == owner:
+            return False
+        between = PIECE_REACH[PIECE_CODES[(piece["name"], owner)]][sy * 9 + sx].get(ey * 9 + ex)
+        if between is None:
+            return False
+        for i in between:
+            if squares[i]:
+                return False
+        return True
 
     def is_stuck(self, x, y, name, owner):
         if name == "歩" or name == "香":
@@ -312,19 +863,15 @@ class ShogiGame:
         return False
 
     def has_nifu(self, x, owner):
-        for y in range(BOARD_SIZE):
-            p = self.board[y][x]
-            if p and p["owner"] == owner and p["name"] == "歩":
-                return True
-        return False
+        pawn = PIECE_CODES[("歩", owner)]
+        squares = self._squares
+        return any(squares[y * 9 + x] == pawn for y in range(BOARD_SIZE))
 
     def find_king(self, owner):
-        for y in range(BOARD_SIZE):
-            for x in range(BOARD_SIZE):
-                p = self.board[y][x]
-                if p and p["owner"] == owner and p["name"] == "王":
-                    return (x, y)
-        return None
+        k = self._king_sq[0 if owner == SENTE else 1]
+        if k is None:
+            return None
+        return (k % 9, k // 9)
 
     def _to_cshogi_board(self, override_turn=None):
         """Build a fresh cshogi.Board from current state.
@@ -356,42 +903,66 @@ class ShogiGame:
         self._cb = cshogi.Board()
         self._cb.set_sfen(self.get_sfen())
 
+    def is_square_attacked(self, x, y, attacker):
+        """(x, y) に attacker の駒の利きがあるか（ピンは無視）。
+
+        対象マスから8方向に最初の駒まで辿り、その駒がこちら向きに一歩/走りで
+        届くかを調べる。桂だけは飛び越すので別に2マスを見る。
+        """
+        squares = self._squares
+        color = 0 if attacker == SENTE else 1
+        t = y * 9 + x
+        for d, first, rest in SQUARE_RAYS[t]:
+            code = squares[first]
+            if code:
+                if code >> 4 == color and ADJACENT_ATTACK_MASKS[code] >> d & 1:
+                    return True
+                continue
+            for i in rest:
+                code = squares[i]
+                if code:
+                    if code >> 4 == color and SLIDE_ATTACK_MASKS[code] >> d & 1:
+                        return True
+                    break
+        knight = color * 16 + cshogi.KNIGHT
+        for i in KNIGHT_SOURCES[color][t]:
+            if squares[i] == knight:
+                return True
+        return False
+
     def is_king_in_check(self, owner):
-        try:
-            return self._get_cb(owner).is_check()
-        except Exception:
-            return self.find_king(owner) is None
+        """owner の玉に王手がかかっているか。
+
+        手番側は同期済みの cshogi 盤面で判定し、手番でない側は盤面を作り直さずに
+        利きを直接調べる（evaluate_board から毎回呼ばれるため）。
+        """
+        if self._cb_synced_for(owner):
+            return self._cb.is_check()
+        k = self._king_sq[0 if owner == SENTE else 1]
+        if k is None:
+            return False
+        return self.is_square_attacked(k % 9, k // 9, owner * -1)
 
     def can_capture_king(self, attacker):
         # Check if 'attacker' can capture the opponent's King immediately
-        opponent = attacker * -1
-        king_pos = self.find_king(opponent)
-        if not king_pos: return False # Already captured?
-        
-        kx, ky = king_pos
-        
-        for y in range(BOARD_SIZE):
-            for x in range(BOARD_SIZE):
-                p = self.board[y][x]
-                if p and p["owner"] == attacker:
-                    # Ignore pin checks, just pure physical reachability
-                    if self.is_pseudo_valid_move((x, y), (kx, ky), p, attacker):
-                        return True
-        return False
+        # (pure physical reachability, pins are ignored)
+        k = self._king_sq[1 if attacker == SENTE else 0]
+        if k is None:
+            return False  # Already captured?
+        return self.is_square_attacked(k % 9, k // 9, attacker)
 
     def simulate_move_check(self, move_type, start_or_name, end, owner, promote=False):
         backup_board_ref = self.board
         temp_board = []
-        for row in self.board:
+        for row in backup_board_ref:
             new_row = []
             for piece in row:
                 if piece: new_row.append(piece.copy())
                 else: new_row.append(None)
             temp_board.append(new_row)
-        self.board = temp_board
         
         try:
-            res = self.apply_move_internal(move_type, start_or_name, end, owner, promote, self.board)
+            res = self.apply_move_internal(move_type, start_or_name, end, owner, promote, temp_board)
         except Exception as e:
             logger.debug("simulate_move_check failed: %s", e)
             res = False
@@ -422,6 +993,8 @@ class ShogiGame:
             if self.is_stuck(ex, ey, name, owner): return False
             if name == "歩" and self.has_nifu(ex, owner): return False
             board_ref[ey][ex] = {"name": name, "owner": owner}
+        # 王手判定は適用後の盤面で行う（呼び出し側が元の盤面に戻す）
+        self.board = board_ref
         if self.is_king_in_check(owner):
             return False
         return True
@@ -431,11 +1004,11 @@ class ShogiGame:
         if move_type == "move":
             sx, sy = start_or_name
             # 1. Piece must exist at source
-            piece = self.board[sy][sx]
+            piece = self.get_piece(sx, sy)
             if piece is None or piece["owner"] != owner: return False
             
             # 2. Destination must not be friendly
-            target = self.board[ey][ex]
+            target = self.get_piece(ex, ey)
             if target and target["owner"] == owner: return False
             
             # 3. Piece movement geometry check
@@ -456,10 +1029,11 @@ class ShogiGame:
         elif move_type == "drop":
             name = start_or_name
             # 1. Must have piece in hand
-            if self.hands[owner].get(name, 0) <= 0: return False
+            hand = HAND_INDEX.get(name)
+            if hand is None or self._hands[0 if owner == SENTE else 1][hand] <= 0: return False
             
             # 2. Destination must be empty
-            if self.board[ey][ex] is not None: return False
+            if self._squares[ey * 9 + ex]: return False
             
             # 3. Stuck check
             if self.is_stuck(ex, ey, name, owner): return False
@@ -473,25 +1047,26 @@ class ShogiGame:
 
     def make_move(self, move_type, start_or_name, end, owner, promote=False):
         ex, ey = end
-        captured = None
+        squares = self._squares
+        captured = 0
         if move_type == "move":
             sx, sy = start_or_name
-            piece = self.board[sy][sx]
-            captured = self.board[ey][ex]
-            self.board[sy][sx] = None
-            name = PIECES[piece["name"]]["promote"] if promote else piece["name"]
-            self.board[ey][ex] = {"name": name, "owner": owner}
+            code = squares[sy * 9 + sx]
+            captured = squares[ey * 9 + ex]
+            squares[sy * 9 + sx] = 0
+            squares[ey * 9 + ex] = PROMOTED_CODE[code] if promote else code
             self.last_move = {"to": end, "owner": owner}
             move_dict = {"type": "move", "from": start_or_name, "to": end, "promote": promote}
         elif move_type == "drop":
             name = start_or_name
-            self.board[ey][ex] = {"name": name, "owner": owner}
-            self.hands[owner][name] -= 1
+            squares[ey * 9 + ex] = PIECE_CODES[(name, owner)]
+            self._hands[0 if owner == SENTE else 1][HAND_INDEX[name]] -= 1
             self.last_move = {"to": end, "owner": owner}
             move_dict = {"type": "drop", "name": name, "to": end}
         if captured:
-            self.add_to_hand(owner, captured["name"])
+            self.add_to_hand(owner, CODE_NAMES[captured])
         self._cb.push_usi(to_usi(move_dict))
+        self._reset_eval_state()
 
     def can_promote(self, sy, ey, owner, piece_name):
         if PIECES[piece_name]["promote"] is None:
@@ -503,45 +1078,25 @@ class ShogiGame:
         """駒の種類に応じて到達可能マスを直接列挙する。
         (tx, ty) を yield する。自駒マスは除外し、敵駒マスは含む（そこでスライドは停止）。
         """
-        piece_info = PIECES[piece["name"]]
-        move_type = piece_info["type"]
-        base_moves = piece_info["moves"]
-        extra_moves = piece_info.get("extra_moves", [])
-        forward = 1 if owner == SENTE else -1
-
-        if move_type in ("step", "jump"):
-            for mx, my in base_moves:
-                tx, ty = x + mx * forward, y + my * forward
-                if not (0 <= tx < BOARD_SIZE and 0 <= ty < BOARD_SIZE):
-                    continue
-                target = self.board[ty][tx]
-                if target and target["owner"] == owner:
-                    continue
-                yield tx, ty
-            return
+        squares = self._squares
+        code = PIECE_CODES[(piece["name"], owner)]
+        i = y * 9 + x
 
         # slide: 各方向にブロッカーまで進む
-        for mx, my in base_moves:
-            dx, dy = mx * forward, my * forward
-            tx, ty = x + dx, y + dy
-            while 0 <= tx < BOARD_SIZE and 0 <= ty < BOARD_SIZE:
-                target = self.board[ty][tx]
-                if target and target["owner"] == owner:
+        for ray in PIECE_RAYS[code][i]:
+            for to in ray:
+                target = squares[to]
+                if target and CODE_OWNERS[target] == owner:
                     break
-                yield tx, ty
+                yield to % 9, to // 9
                 if target:
                     break
-                tx += dx
-                ty += dy
-        # 馬/竜の追加一歩
-        for mx, my in extra_moves:
-            tx, ty = x + mx * forward, y + my * forward
-            if not (0 <= tx < BOARD_SIZE and 0 <= ty < BOARD_SIZE):
+        # 一歩・桂跳び・馬/竜の追加一歩
+        for to in PIECE_STEPS[code][i]:
+            target = squares[to]
+            if target and CODE_OWNERS[target] == owner:
                 continue
-            target = self.board[ty][tx]
-            if target and target["owner"] == owner:
-                continue
-            yield tx, ty
+            yield to % 9, to // 9
 
     def get_legal_moves(self, owner):
         """Return owner's legal moves as the legacy dict format.
@@ -549,186 +1104,67 @@ class ShogiGame:
         Uses the in-sync self._cb when possible (no SFEN roundtrip).
         """
         cb = self._get_cb(owner)
-        moves = []
-        for m in cb.legal_moves:
-            usi = cshogi.move_to_usi(m)
-            d = parse_usi_string(usi)
-            d["to"] = tuple(d["to"])
-            if d["type"] == "move":
-                d["from"] = tuple(d["from"])
-            moves.append(d)
-        return moves
+        return [move_to_dict(m) for m in cb.legal_moves]
 
     def evaluate_board(self):
-        """強化版評価関数: 駒価値 + 位置評価 + 玉安全度 + 防御評価 + 終盤補正"""
-        score = 0
+        """強化版評価関数: 駒価値 + 位置評価 + 玉安全度 + 防御評価 + 終盤補正
 
-        # --- 盤面の駒の総価値で終盤判定 ---
-        total_material = 0
-        for y in range(BOARD_SIZE):
-            for x in range(BOARD_SIZE):
-                p = self.board[y][x]
-                if p and p["name"] != "王":
-                    total_material += PIECE_VALUES.get(p["name"], 0)
-        for owner in [SENTE, GOTE]:
-            for name, count in self.hands[owner].items():
-                total_material += PIECE_VALUES.get(name, 0) * count
-        is_endgame = total_material < 4000
+        駒価値・位置評価・大駒侵入ペナルティ・持ち駒と総駒価値は _apply_move/_undo_move が
+        差分更新した値を使い、盤面の走査は玉周辺の項だけに限る。
+        """
+        # --- 1. 駒価値 + 位置評価 / 3. 敵大駒の自陣侵入ペナルティ（差分更新済み） ---
+        # --- 2. 玉の安全度 / 4. 歩の防壁 / 5. 王手状態のペナルティ ---
+        score = self._psq_score + self._positional_score()
 
-        # --- 1. 駒価値 + 位置評価 ---
-        for y in range(BOARD_SIZE):
-            for x in range(BOARD_SIZE):
-                p = self.board[y][x]
-                if p:
-                    val = PIECE_VALUES.get(p["name"], 0)
-
-                    # 位置評価テーブルの参照
-                    pst = PST_MAP.get(p["name"])
-                    pos_bonus = 0
-                    if pst:
-                        if p["owner"] == SENTE:
-                            pos_bonus = pst[y][x]
-                        else:  # GOTE: テーブルを上下反転
-                            pos_bonus = pst[8 - y][8 - x]
-
-                    if p["owner"] == GOTE:
-                        score += (val + pos_bonus)
-                    else:
-                        score -= (val + pos_bonus)
+        # --- 6. 持ち駒の評価（盤面の駒の総価値で終盤判定） ---
+        hand_multiplier = 1.6 if self._material < 4000 else 1.3
+        score += self._hand_value[1] * hand_multiplier
+        score -= self._hand_value[0] * hand_multiplier
+
+        return score
+
+    def _positional_score(self):
+        """evaluate_board のうち盤面の走査が必要な項（玉の安全度・歩の防壁・王手）。整数を返す。"""
+        squares = self._squares
+        score = 0
 
         # --- 2. 玉の安全度（大幅強化版） ---
-        for owner in [SENTE, GOTE]:
-            k_pos = self.find_king(owner)
-            if not k_pos:
+        for color, owner in ((0, SENTE), (1, GOTE)):
+            k = self._king_sq[color]
+            if k is None:
                 continue
-            kx, ky = k_pos
-            safety_score = 0
-            opponent = owner * -1
+            kx, ky = k % 9, k // 9
             sign = 1 if owner == GOTE else -1
 
-            # 2a. 玉周辺の味方駒ボーナス + 空きマスペナルティ（3x3）
-            defender_values = {"金": 250, "銀": 200, "全": 200, "と": 180,
-                               "杏": 150, "圭": 150, "馬": 120, "竜": 120,
-                               "歩": 60, "香": 80, "桂": 40}
-            empty_near_king = 0
-            for dy_k in [-1, 0, 1]:
-                for dx_k in [-1, 0, 1]:
-                    if dx_k == 0 and dy_k == 0:
-                        continue
-                    tx, ty = kx + dx_k, ky + dy_k
-                    if 0 <= tx < BOARD_SIZE and 0 <= ty < BOARD_SIZE:
-                        tp = self.board[ty][tx]
-                        if tp and tp["owner"] == owner:
-                            safety_score += defender_values.get(tp["name"], 50)
-                        elif tp is None:
-                            empty_near_king += 1
-                    # 盤外は安全とみなす（端の玉は逃げ場が少ないが壁がある）
-
-            # 空きマスが多い = 守りが薄い（ペナルティ）
-            if empty_near_king >= 5:
-                safety_score -= 200
-            elif empty_near_king >= 3:
-                safety_score -= 80
+            # 2a. 玉周辺の守り駒 / 2c. 端玉 / 4. 歩の防壁（囲いハッシュを引く）
+            safety_score = self._king_shelter_score(color, k)
 
             # 2b. 敵の大駒の脅威（飛角竜馬）
-            for y2 in range(BOARD_SIZE):
-                for x2 in range(BOARD_SIZE):
-                    ep = self.board[y2][x2]
-                    if ep and ep["owner"] == opponent:
-                        if ep["name"] in ["飛", "竜"]:
-                            # 同じ行 or 同じ列 → ラインアタック
-                            if x2 == kx or y2 == ky:
-                                dist = abs(x2 - kx) + abs(y2 - ky)
-                                safety_score -= max(0, 400 - dist * 30)
-                            # 竜は隣接もチェック（全方向に動けるので）
-                            if ep["name"] == "竜":
-                                dist = max(abs(x2 - kx), abs(y2 - ky))
-                                if dist <= 2:
-                                    safety_score -= 300
-                        if ep["name"] in ["角", "馬"]:
-                            # 同じ対角線
-                            if abs(x2 - kx) == abs(y2 - ky) and x2 != kx:
-                                dist = abs(x2 - kx)
-                                safety_score -= max(0, 300 - dist * 25)
-                            # 馬は隣接もチェック
-                            if ep["name"] == "馬":
-                                dist = max(abs(x2 - kx), abs(y2 - ky))
-                                if dist <= 2:
-                                    safety_score -= 250
-
-            # 2c. 玉が端にいることのボーナス（自陣のみ）
-            if owner == SENTE and ky >= 7:
-                if kx <= 1 or kx >= 7:
-                    safety_score += 80
-            elif owner == GOTE and ky <= 1:
-                if kx <= 1 or kx >= 7:
-                    safety_score += 80
+            for i in self._piece_list[color ^ 1]:
+                piece_type = squares[i] & 15
+                if piece_type == cshogi.ROOK or piece_type == cshogi.PROM_ROOK:
+                    x2, y2 = i % 9, i // 9
+                    # 同じ行 or 同じ列 → ラインアタック
+                    if x2 == kx or y2 == ky:
+                        dist = abs(x2 - kx) + abs(y2 - ky)
+                        safety_score -= max(0, 400 - dist * 30)
+                    # 竜は隣接もチェック（全方向に動けるので）
+                    if piece_type == cshogi.PROM_ROOK:
+                        if max(abs(x2 - kx), abs(y2 - ky)) <= 2:
+                            safety_score -= 300
+                elif piece_type == cshogi.BISHOP or piece_type == cshogi.PROM_BISHOP:
+                    x2, y2 = i % 9, i // 9
+                    # 同じ対角線
+                    if abs(x2 - kx) == abs(y2 - ky) and x2 != kx:
+                        dist = abs(x2 - kx)
+                        safety_score -= max(0, 300 - dist * 25)
+                    # 馬は隣接もチェック
+                    if piece_type == cshogi.PROM_BISHOP:
+                        if max(abs(x2 - kx), abs(y2 - ky)) <= 2:
+                            safety_score -= 250
 
             score += safety_score * sign
 
-        # --- 3. 敵大駒の自陣侵入ペナルティ ---
-        # 相手の飛角竜馬が自陣にいると非常に危険
-        invasion_penalty = {"飛": 600, "竜": 900, "角": 400, "馬": 700}
-        for y in range(BOARD_SIZE):
-            for x in range(BOARD_SIZE):
-                p = self.board[y][x]
-                if p and p["name"] in invasion_penalty:
-                    penalty = invasion_penalty[p["name"]]
-                    if p["owner"] == SENTE:
-                        # 先手の大駒が後手陣(y<=2)にいる → 後手にとって脅威
-                        if y <= 2:
-                            depth_bonus = (2 - y) * 100  # 奥に入るほど危険
-                            score -= (penalty + depth_bonus)  # 先手有利
-                    else:  # GOTE
-                        # 後手の大駒が先手陣(y>=6)にいる → 先手にとって脅威
-                        if y >= 6:
-                            depth_bonus = (y - 6) * 100
-                            score += (penalty + depth_bonus)  # 後手有利
-
-        # --- 4. 玉前面の歩の防壁チェック ---
-        # 玉の前の筋に歩がない（飛車先が空いている）= 危険
-        for owner in [SENTE, GOTE]:
-            k_pos = self.find_king(owner)
-            if not k_pos:
-                continue
-            kx, ky = k_pos
-            sign = 1 if owner == GOTE else -1
-
-            # 玉の前方3筋をチェック（自分の歩があるか）
-            pawn_shield = 0
-            for dx in [-1, 0, 1]:
-                col = kx + dx
-                if col < 0 or col >= BOARD_SIZE:
-                    pawn_shield += 1  # 盤外はOK
-                    continue
-                has_pawn = False
-                # 先手なら前方(y小さい方)、後手なら前方(y大きい方)
-                if owner == SENTE:
-                    for check_y in range(ky - 1, -1, -1):
-                        p = self.board[check_y][col]
-                        if p and p["owner"] == owner and p["name"] == "歩":
-                            has_pawn = True
-                            break
-                        if p and p["owner"] != owner:
-                            break  # 相手の駒に遮られている
-                else:
-                    for check_y in range(ky + 1, BOARD_SIZE):
-                        p = self.board[check_y][col]
-                        if p and p["owner"] == owner and p["name"] == "歩":
-                            has_pawn = True
-                            break
-                        if p and p["owner"] != owner:
-                            break
-                if has_pawn:
-                    pawn_shield += 1
-
-            if pawn_shield == 0:
-                score += sign * (-300)  # 3筋とも歩なし = 非常に危険
-            elif pawn_shield == 1:
-                score += sign * (-150)  # 2筋の歩がない
-            elif pawn_shield == 2:
-                score += sign * (-50)   # 1筋の歩がない
-
         # --- 5. 王手状態のペナルティ ---
         # 自分が王手されている = 非常に悪い局面
         for owner in [SENTE, GOTE]:
@@ -736,15 +1172,148 @@ class ShogiGame:
                 sign = 1 if owner == GOTE else -1
                 score += sign * (-500)
 
-        # --- 6. 持ち駒の評価 ---
-        hand_multiplier = 1.6 if is_endgame else 1.3
-        for name, count in self.hands[GOTE].items():
-            score += PIECE_VALUES.get(name, 0) * count * hand_multiplier
-        for name, count in self.hands[SENTE].items():
-            score -= PIECE_VALUES.get(name, 0) * count * hand_multiplier
+        return score
+
+    def _king_shelter_score(self, color, k):
+        """color 側の玉（添字 k）の囲いの評価（color 側から見た値）: 2a + 2c + 4。
+
+        自分の歩の配置・玉の位置・玉周辺3x3の駒が同じなら囲いハッシュの値を使い、盤面を走査しない。
+        """
+        squares = self._squares
+        r0, r1, r2, r3, r4, r5 = SHELTER_ROWS[k]
+        key = self._pawn_keys[color] ^ KING_SQ_KEYS[color][k] ^ \
+            hash(bytes(squares[r0:r1] + squares[r2:r3] + squares[r4:r5]))
+        safety_score = self._shelter.probe(key, squares)
+        if safety_score is not None:
+            return safety_score
+
+        kx, ky = k % 9, k // 9
+        safety_score = 0
+
+        # 2a. 玉周辺の味方駒ボーナス + 空きマスペナルティ（3x3）
+        # 盤外は安全とみなす（端の玉は逃げ場が少ないが壁がある）
+        empty_near_king = 0
+        for i in KING_NEIGHBORS[k]:
+            code = squares[i]
+            if not code:
+                empty_near_king += 1
+            elif code >> 4 == color:
+                safety_score += DEFENDER_BY_CODE[code]
+
+        # 空きマスが多い = 守りが薄い（ペナルティ）
+        if empty_near_king >= 5:
+            safety_score -= 200
+        elif empty_near_king >= 3:
+            safety_score -= 80
+
+        # 2c. 玉が端にいることのボーナス（自陣のみ）
+        if color == 0 and ky >= 7:
+            if kx <= 1 or kx >= 7:
+                safety_score += 80
+        elif color == 1 and ky <= 1:
+            if kx <= 1 or kx >= 7:
+                safety_score += 80
+
+        # --- 4. 玉前面の歩の防壁チェック ---
+        # 玉の前の筋に歩がない（飛車先が空いている）= 危険
+        # 玉の前方3筋をチェック: 自分の歩があり、玉との間に相手の駒がなければ防壁あり
+        # 先手なら前方(y小さい方)、後手なら前方(y大きい方)
+        pawn = color * 16 + PAWN_TYPE
+        ahead = range(ky - 1, -1, -1) if color == 0 else range(ky + 1, BOARD_SIZE)
+        pawn_shield = 0
+        extra = []  # 玉周辺3x3より先で歩との間にあるマス（キーに含まれないのでエントリで確かめる）
+        for col in (kx - 1, kx, kx + 1):
+            if col < 0 or col >= BOARD_SIZE:
+                pawn_shield += 1  # 盤外はOK
+                continue
+            between = []
+            for check_y in ahead:
+                i = check_y * 9 + col
+                if squares[i] == pawn:
+                    # 相手の駒に遮られていなければ防壁
+                    if not any(squares[j] and squares[j] >> 4 != color for j in between):
+                        pawn_shield += 1
+                    extra.extend(between[1:])
+                    break
+                between.append(i)
+
+        if pawn_shield == 0:
+            safety_score -= 300  # 3筋とも歩なし = 非常に危険
+        elif pawn_shield == 1:
+            safety_score -= 150  # 2筋の歩がない
+        elif pawn_shield == 2:
+            safety_score -= 50   # 1筋の歩がない
+
+        self._shelter.store(key, safety_score, tuple(extra), squares)
+        return safety_score
+
+    def _static_eval(self):
+        """探索用の evaluate_board: 評価値キャッシュにあればそれを使い、なければ計算して覚える。"""
+        cache = self._eval_cache
+        if cache is None:
+            return self.evaluate_board()
+        key = self._cb.zobrist_hash()
+        score = cache.probe(key)
+        if score is None:
+            score = self.evaluate_board()
+            cache.store(key, score)
+        return score
+
+    def evaluate_lazy(self, alpha, beta):
+        """遅延評価: 窓 (alpha, beta) の外と分かれば玉周辺の項を計算せずに返す（静止探索用）。
 
+        見積もり = 駒価値+位置評価+持ち駒 + 直前に計算した玉周辺の項。見積もりが窓から
+        マージン以上外れていれば見積もりをそのまま返し、それ以外は evaluate_board と同じ値を返す。
+        評価値キャッシュにある局面はキャッシュの値を返し、計算した評価値はキャッシュに覚える。
+        """
+        cache = self._eval_cache
+        if cache is not None:
+            key = self._cb.zobrist_hash()
+            score = cache.probe(key)
+            if score is not None:
+                return score
+        hand_multiplier = 1.6 if self._material < 4000 else 1.3
+        material = self._psq_score + (self._hand_value[1] - self._hand_value[0]) * hand_multiplier
+        estimate = material + self._lazy_positional
+        margin = self._lazy_margin
+        self._lazy_evals += 1
+        if estimate - margin >= beta or estimate + margin <= alpha:
+            self._lazy_skips += 1
+            return estimate
+
+        positional = self._positional_score()
+        samples = self._lazy_samples
+        samples.append(abs(positional - self._lazy_positional))
+        if len(samples) >= LAZY_EVAL_SAMPLES:
+            samples.sort()
+            self._lazy_margin = max(LAZY_EVAL_MIN_MARGIN, samples[int(len(samples) * LAZY_EVAL_QUANTILE)])
+            samples.clear()
+        self._lazy_positional = positional
+
+        score = self._psq_score + positional
+        score += self._hand_value[1] * hand_multiplier
+        score -= self._hand_value[0] * hand_multiplier
+        if cache is not None:
+            cache.store(key, score)
         return score
 
+    def evaluate_batch(self, moves):
+        """現局面から各手を指した後の局面を、batch_eval でまとめて評価する（探索用）。
+
+        moves は手番側の cshogi 整数 move のリスト。戻り値は evaluate_board と
+        同じ値の float リストで、moves と同じ順に並ぶ。numpy が必要。
+        """
+        from batch_eval import encode_position, get_batch_evaluator  # batch_eval が game_logic を import するため遅延
+
+        positions = []
+        for move in moves:
+            self._apply_move(move)
+            positions.append(encode_position(self))
+            self._undo_move()
+        if not positions:
+            return []
+        return get_batch_evaluator().evaluate(positions).tolist()
+
     # === JSON Serialization for Firestore ===
     def to_dict(self):
         return {
@@ -761,9 +1330,10 @@ class ShogiGame:
         self.board = state.get("board", self.board)
         # Convert keys in hands back to int if they became strings (JSON dict keys are strings)
         raw_hands = state.get("hands", self.hands)
-        self.hands = {}
+        hands = {}
         for k, v in raw_hands.items():
-            self.hands[int(k)] = v
+            hands[int(k)] = v
+        self.hands = hands
 
         self.turn = state.get("turn", self.turn)
         self.game_over = state.get("game_over", self.game_over)
@@ -774,20 +1344,21 @@ class ShogiGame:
 
     # === SFEN生成機能 ===
     def get_sfen(self):
+        squares = self._squares
         sfen_rows = []
         for y in range(BOARD_SIZE):
             empty_count = 0
             row_str = ""
             for x in range(BOARD_SIZE):
-                piece = self.board[y][x]
-                if piece is None:
+                code = squares[y * 9 + x]
+                if not code:
                     empty_count += 1
                 else:
                     if empty_count > 0:
                         row_str += str(empty_count)
                         empty_count = 0
-                    char = SFEN_MAP[piece["name"]]
-                    if piece["owner"] == GOTE:
+                    char = SFEN_MAP[CODE_NAMES[code]]
+                    if code >> 4:
                         char = char.lower()
                     row_str += char
             if empty_count > 0:
@@ -797,13 +1368,15 @@ class ShogiGame:
         board_sfen = "/".join(sfen_rows)
         turn_sfen = "b" if self.turn == SENTE else "w"
         
+        # 持ち駒は SFEN の慣例どおり 飛角金銀桂香歩 の順
         hands_sfen = ""
-        for owner in (SENTE, GOTE):
-            for name, count in self.hands[owner].items():
+        for color in (0, 1):
+            for hand in SFEN_HAND_ORDER:
+                count = self._hands[color][hand]
                 if count <= 0:
                     continue
-                char = SFEN_MAP[name]
-                if owner == GOTE:
+                char = SFEN_MAP[CSHOGI_HAND_PIECE_NAMES[hand]]
+                if color:
                     char = char.lower()
                 hands_sfen += (str(count) if count > 1 else "") + char
         if not hands_sfen:
@@ -822,209 +1395,397 @@ class ShogiGame:
 
         try:
             parts = sfen.split(" ")
-            board_str = parts[0]
-            turn_str = parts[1]
-            hands_str = parts[2]
             move_count_str = parts[3] if len(parts) > 3 else "1"
 
-            # Reset Board
-            self.board = [[None for _ in range(BOARD_SIZE)] for _ in range(BOARD_SIZE)]
-            
-            # Reverse Map
-            reverse_map = {v: k for k, v in SFEN_MAP.items()}
-            
-            # Parse Board
-            rows = board_str.split("/")
-            for y, row_data in enumerate(rows):
-                x = 0
-                i = 0
-                while i < len(row_data):
-                    char = row_data[i]
-                    if char.isdigit():
-                        x += int(char)
-                        i += 1
-                        continue
-                        
-                    is_promoted = False
-                    if char == "+":
-                        is_promoted = True
-                        i += 1
-                        char = row_data[i]
-                        
-                    if x >= BOARD_SIZE: break 
-                    
-                    owner = SENTE if char.isupper() else GOTE
-                    sfen_char = "+" + char.upper() if is_promoted else char.upper()
-                    
-                    name = reverse_map.get(sfen_char)
-                    if not name:
-                         # Fallback for simple chars if + missing in map (though SFEN_MAP has +P etc)
-                         name = reverse_map.get(char.upper())
-
-                    if name:
-                        self.board[y][x] = {"name": name, "owner": owner}
-                    x += 1
-                    i += 1
-            
+            # 盤面と持ち駒は検証済みの cshogi 盤面からそのまま写す（駒コードは共通）
+            squares = bytearray(81)
+            for sq, code in enumerate(_validator.pieces):
+                squares[SQ_TO_INDEX[sq]] = code
+            self._squares = squares
+            self._hands = [list(h) for h in _validator.pieces_in_hand]
+
             # Parse Turn
-            self.turn = SENTE if turn_str == 'b' else GOTE
+            self.turn = SENTE if _validator.turn == cshogi.BLACK else GOTE
             
             # Parse Move Count
             self.move_count = int(move_count_str)
-            
-            # Parse Hands
-            self.hands = {SENTE: {}, GOTE: {}}
-            if hands_str != "-":
-                i = 0
-                while i < len(hands_str):
-                    count = 1
-                    num_str = ""
-                    while i < len(hands_str) and hands_str[i].isdigit():
-                        num_str += hands_str[i]
-                        i += 1
-                    if num_str:
-                        count = int(num_str)
-                    
-                    if i < len(hands_str):
-                        char = hands_str[i]
-                        owner = SENTE if char.isupper() else GOTE
-                        name = reverse_map.get(char.upper())
-                        if name:
-                            # Original names logic
-                            # In hand, pieces are unpromoted usually.
-                            self.hands[owner][name] = self.hands[owner].get(name, 0) + count
-                        i += 1
 
         except Exception as e:
             logger.error("Error parsing SFEN: %s", e)
             raise
 
+        self._reset_eval_state()
         self._resync_cb()
 
-    def _apply_move(self, move, owner):
-        """手を適用し、undo情報を返す（copy.deepcopy不要の高速化）"""
-        ex, ey = move["to"]
-        undo = {"move": move, "owner": owner, "captured": None,
-                "old_last_move": self.last_move}
-
-        if move["type"] == "move":
-            sx, sy = move["from"]
-            piece = self.board[sy][sx]
-            undo["src_piece"] = piece
-            captured = self.board[ey][ex]
-            undo["captured"] = captured
-
-            self.board[sy][sx] = None
-            if move["promote"]:
-                name = PIECES[piece["name"]]["promote"]
-            else:
-                name = piece["name"]
-            self.board[ey][ex] = {"name": name, "owner": owner}
+    def _apply_move(self, move):
+        """cshogi の整数 move を手番側の手として適用する（探索用）。
 
+        undo 情報は事前確保したスタックに積み、_undo_move() で戻す。
+        last_move は API 向けの情報なので探索中は更新しない。
+        """
+        ply = self._ply
+        color = self._cb.turn
+        squares = self._squares
+        to = SQ_TO_INDEX[cshogi.move_to(move)]
+        self._undo_moves[ply] = move
+        self._undo_psq[ply] = self._psq_score
+        self._undo_material[ply] = self._material
+
+        if cshogi.move_is_drop(move):
+            hand = cshogi.move_drop_hand_piece(move)
+            code = HAND_TO_CODE[color][hand]
+            squares[to] = code
+            self._hands[color][hand] -= 1
+            self._hand_value[color] -= HAND_VALUES[hand]
+            self._piece_index[to] = len(self._piece_list[color])
+            self._piece_list[color].append(to)
+            self._undo_captured[ply] = 0
+            # 持ち駒 -> 盤上なので総駒価値は変わらない
+            self._psq_score += PSQ_BY_CODE[code][to]
+            if hand == cshogi.HPAWN:
+                self._pawn_keys[color] ^= PAWN_KEYS[color][to]
+        else:
+            frm = SQ_TO_INDEX[cshogi.move_from(move)]
+            code = squares[frm]
+            captured = squares[to]
+            self._undo_captured[ply] = captured
             if captured:
-                cap_name = UNPROMOTION_MAP.get(captured["name"], captured["name"])
-                if cap_name in self.hands[owner]:
-                    self.hands[owner][cap_name] += 1
-                else:
-                    self.hands[owner][cap_name] = 1
-                undo["cap_original"] = cap_name
-        else:  # drop
-            name = move["name"]
-            self.board[ey][ex] = {"name": name, "owner": owner}
-            self.hands[owner][name] -= 1
-
-        self._cb.push_usi(to_usi(move))
-        self.last_move = {"to": (ex, ey), "owner": owner}
+                hand = CODE_TO_HAND[captured]
+                self._hands[color][hand] += 1
+                self._hand_value[color] += HAND_VALUES[hand]
+                self._piece_list_remove(color ^ 1, to)
+                self._psq_score -= PSQ_BY_CODE[captured][to]
+                self._material += HAND_VALUES[hand] - MATERIAL_BY_CODE[captured]
+                if captured & 15 == PAWN_TYPE:
+                    self._pawn_keys[color ^ 1] ^= PAWN_KEYS[color ^ 1][to]
+
+            new_code = PROMOTED_CODE[code] if cshogi.move_is_promotion(move) else code
+            squares[frm] = 0
+            squares[to] = new_code
+            idx = self._piece_index[frm]
+            self._piece_list[color][idx] = to
+            self._piece_index[to] = idx
+            self._psq_score += PSQ_BY_CODE[new_code][to] - PSQ_BY_CODE[code][frm]
+            self._material += MATERIAL_BY_CODE[new_code] - MATERIAL_BY_CODE[code]
+            if code & 15 == KING_TYPE:
+                self._king_sq[color] = to
+            elif code & 15 == PAWN_TYPE:
+                self._pawn_keys[color] ^= PAWN_KEYS[color][frm]
+                if new_code == code:
+                    self._pawn_keys[color] ^= PAWN_KEYS[color][to]
+
+        self._cb.push(move)
+        self._ply = ply + 1
         self.turn *= -1
         self.move_count += 1
-        return undo
-
-    def _undo_move(self, undo):
-        """_apply_moveで得たundo情報から手を元に戻す"""
-        move = undo["move"]
-        owner = undo["owner"]
-        ex, ey = move["to"]
+        key = self._cb.zobrist_hash()
+        self._hash_stack[ply + 1] = key
+        self._repetitions[key] = self._repetitions.get(key, 0) + 1
 
+    def _undo_move(self):
+        """直前の _apply_move を元に戻す"""
         self._cb.pop()
         self.turn *= -1
         self.move_count -= 1
-        self.last_move = undo["old_last_move"]
-
-        if move["type"] == "move":
-            sx, sy = move["from"]
-            self.board[sy][sx] = undo["src_piece"]
-            self.board[ey][ex] = undo["captured"]
-
-            if undo["captured"]:
-                cap_name = undo["cap_original"]
-                self.hands[owner][cap_name] -= 1
-                if self.hands[owner][cap_name] == 0:
-                    del self.hands[owner][cap_name]
-        else:  # drop
-            name = move["name"]
-            self.board[ey][ex] = None
-            self.hands[owner][name] = self.hands[owner].get(name, 0) + 1
+        ply = self._ply - 1
+        self._ply = ply
+        key = self._hash_stack[ply + 1]
+        count = self._repetitions.get(key, 0)
+        if count > 1:
+            self._repetitions[key] = count - 1
+        else:
+            self._repetitions.pop(key, None)
+        color = self._cb.turn
+        squares = self._squares
+        move = self._undo_moves[ply]
+        to = SQ_TO_INDEX[cshogi.move_to(move)]
+        self._psq_score = self._undo_psq[ply]
+        self._material = self._undo_material[ply]
+
+        if cshogi.move_is_drop(move):
+            hand = cshogi.move_drop_hand_piece(move)
+            squares[to] = 0
+            self._hands[color][hand] += 1
+            self._hand_value[color] += HAND_VALUES[hand]
+            self._piece_list_remove(color, to)
+            if hand == cshogi.HPAWN:
+                self._pawn_keys[color] ^= PAWN_KEYS[color][to]
+        else:
+            frm = SQ_TO_INDEX[cshogi.move_from(move)]
+            captured = self._undo_captured[ply]
+            code = squares[to]
+            if cshogi.move_is_promotion(move):
+                code ^= PROMOTED_BIT
+            squares[frm] = code
+            squares[to] = captured
+            idx = self._piece_index[to]
+            self._piece_list[color][idx] = frm
+            self._piece_index[frm] = idx
+            if code & 15 == KING_TYPE:
+                self._king_sq[color] = frm
+            elif code & 15 == PAWN_TYPE:
+                self._pawn_keys[color] ^= PAWN_KEYS[color][frm]
+                if not cshogi.move_is_promotion(move):
+                    self._pawn_keys[color] ^= PAWN_KEYS[color][to]
+            if captured:
+                hand = CODE_TO_HAND[captured]
+                self._hands[color][hand] -= 1
+                self._hand_value[color] -= HAND_VALUES[hand]
+                self._piece_index[to] = len(self._piece_list[color ^ 1])
+                self._piece_list[color ^ 1].append(to)
+                if captured & 15 == PAWN_TYPE:
+                    self._pawn_keys[color ^ 1] ^= PAWN_KEYS[color ^ 1][to]
+
+    def _apply_null_move(self):
+        """ヌルムーブ（パス）を適用する（探索用）。undo スタックには 0 を積む。
+
+        パス後の局面は実際には現れないので、千日手の出現回数には数えない。
+        """
+        self._undo_moves[self._ply] = 0
+        self._cb.push_pass()
+        self._ply += 1
+        self._hash_stack[self._ply] = 0
+        self.turn *= -1
+
+    def _undo_null_move(self):
+        """直前の _apply_null_move を元に戻す"""
+        self._cb.pop_pass()
+        self._ply -= 1
+        self.turn *= -1
+
+    def _least_valuable_attacker(self, target, color, removed):
+        """target（盤面添字）に利きのある color 側の最も安い駒を (価値, 添字) で返す。
+
+        removed のマスは空きとみなすので、前の駒が取り合いで動いた後ろの走り駒（x-ray）も拾える。
+        見つからなければ (0, -1)。ピンは無視する。
+        """
+        squares = self._squares
+        best_value, best_index = 0, -1
+        for d, first, rest in SQUARE_RAYS[target]:
+            # 方向 d で最初に当たる駒（隣なら一歩の利き、その先なら走りの利きで届くか）
+            i = first
+            code = squares[i]
+            mask = ADJACENT_ATTACK_MASKS
+            if not code or i in removed:
+                mask = SLIDE_ATTACK_MASKS
+                for i in rest:
+                    code = squares[i]
+                    if code and i not in removed:
+                        break
+                else:
+                    continue
+            if code >> 4 == color and mask[code] >> d & 1:
+                value = PIECE_TYPE_VALUES[code & 15]
+                if best_index < 0 or value < best_value:
+                    best_value, best_index = value, i
+        knight = color * 16 + cshogi.KNIGHT
+        for i in KNIGHT_SOURCES[color][target]:
+            if squares[i] == knight and i not in removed:
+                value = PIECE_TYPE_VALUES[cshogi.KNIGHT]
+                if best_index < 0 or value < best_value:
+                    best_value, best_index = value, i
+        return best_value, best_index
+
+    def _see(self, move):
+        """静的交換評価: 駒取りの手 move の後、そのマスで互いに最も安い駒で取り返し続けたときの駒得。
+
+        各手番は取り返さずに止めることもできるものとして、手番側から見た結果を返す（成りは無視）。
+        """
+        target = SQ_TO_INDEX[move & MOVE_SQ_MASK]
+        frm = SQ_TO_INDEX[(move >> MOVE_FROM_SHIFT) & MOVE_SQ_MASK]
+        gains = [PIECE_TYPE_VALUES[(move >> MOVE_CAPTURE_SHIFT) & 15]]
+        on_square = PIECE_TYPE_VALUES[(move >> MOVE_PIECE_SHIFT) & 15]
+        removed = [frm]
+        side = (self._squares[frm] >> 4) ^ 1
+        while True:
+            value, index = self._least_valuable_attacker(target, side, removed)
+            if index < 0:
+                break
+            gains.append(on_square - gains[-1])
+            on_square = value
+            removed.append(index)
+            side ^= 1
+        for k in range(len(gains) - 1, 0, -1):
+            gains[k - 1] = -max(-gains[k - 1], gains[k])
+        return gains[0]
 
     def _score_move(self, move, owner):
         """手の順序付けのためのスコアリング（MVV-LVA + 成り優先）"""
         score = 0
-        ex, ey = move["to"]
-
-        if move["type"] == "move":
-            # 駒取りの手: MVV-LVA (Most Valuable Victim - Least Valuable Attacker)
-            target = self.board[ey][ex]
-            if target and target["owner"] != owner:
-                victim_val = PIECE_VALUES.get(target["name"], 0)
-                sx, sy = move["from"]
-                attacker = self.board[sy][sx]
-                attacker_val = PIECE_VALUES.get(attacker["name"], 0) if attacker else 0
-                score += 10000 + victim_val * 10 - attacker_val
-
-            # 成りの手
-            if move.get("promote"):
-                sx, sy = move["from"]
-                piece = self.board[sy][sx]
-                if piece:
-                    promoted_name = PIECES[piece["name"]].get("promote")
-                    if promoted_name:
-                        score += 5000 + (PIECE_VALUES.get(promoted_name, 0) - PIECE_VALUES.get(piece["name"], 0))
-        else:  # drop
+
+        if (move >> MOVE_FROM_SHIFT) & MOVE_SQ_MASK >= 81:
             # 打ち込みは中程度の優先度
             score += 100
             # 敵陣への打ち込みはボーナス
+            ey = (move & MOVE_SQ_MASK) % 9
             if owner == SENTE and ey <= 2:
                 score += 200
             elif owner == GOTE and ey >= 6:
                 score += 200
+            return score
+
+        # 駒取りの手: MVV-LVA (Most Valuable Victim - Least Valuable Attacker)
+        piece_type = (move >> MOVE_PIECE_SHIFT) & 15
+        captured = (move >> MOVE_CAPTURE_SHIFT) & 15
+        if captured:
+            victim_val = PIECE_TYPE_VALUES[captured]
+            attacker_val = PIECE_TYPE_VALUES[piece_type]
+            score += 10000 + victim_val * 10 - attacker_val
+
+        # 成りの手
+        if move & MOVE_PROMOTE_BIT:
+            score += 5000 + PROMOTION_GAINS[piece_type]
 
         return score
 
-    def _order_moves(self, moves, owner):
-        """手を評価順にソート（alpha-beta枝刈りの効率化）"""
-        scored = [(self._score_move(m, owner), random.random(), m) for m in moves]
-        scored.sort(key=lambda x: (-x[0], x[1]))  # スコア降順、同点はランダム
-        return [m for _, _, m in scored]
+    def _order_moves(self, moves, owner, hash_move=None):
+        """手を評価順にソート（alpha-beta枝刈りの効率化）。置換表の最善手があれば最優先。"""
+        # スコアは整数なので [0, 1) の乱数を足して、スコア降順・同点はランダムの1キーで並べる
+        rand = self._rng.random
+        score_move = self._score_move
+        scored = [(HASH_MOVE_SCORE if m == hash_move else score_move(m, owner)) + rand() for m in moves]
+        order = sorted(range(len(moves)), key=scored.__getitem__, reverse=True)
+        return [moves[i] for i in order]
 
-    def _generate_captures(self, owner):
-        """指定 owner の駒取りの手だけを列挙する（cshogi の合法手から駒取りのみ抽出）。"""
-        cb = self._get_cb(owner)
-        captures = []
+    def _drop_candidate_squares(self, color):
+        """打つ手を読む価値のあるマスの一覧（盤面添字ごとのフラグ）。
+
+        双方の玉の近く、相手の駒の隣（当たりをかける）、相手の利きがある自分の駒の隣（守る）。
+        """
+        squares = self._squares
+        relevant = bytearray(81)
+        for k in self._king_sq:
+            if k is not None:
+                for i in KING_ZONES[k]:
+                    relevant[i] = 1
+        for i in self._piece_list[color ^ 1]:
+            for j in KING_NEIGHBORS[i]:
+                relevant[j] = 1
+        attacker = GOTE if color == 0 else SENTE
+        for i in self._piece_list[color]:
+            code = squares[i]
+            if code & 15 != cshogi.PAWN and code & 15 != KING_TYPE and \
+                    self.is_square_attacked(i % 9, i // 9, attacker):
+                for j in KING_NEIGHBORS[i]:
+                    relevant[j] = 1
+        return relevant
+
+    def _pick_moves(self, owner, ply, first_move=None, prune_drops=False):
+        """通常探索用に手を段階的に列挙するジェネレータ。
+
+        1. 置換表 / 読み筋の手（合法手リストを作る前に試す）
+        2. 駒取り・成り（MVV-LVA 順）
+        3. キラー手・カウンター手
+        4. 盤上の駒の静かな手（history 順）
+        5. 打つ手（history 順）。prune_drops なら _drop_candidate_squares のマスへの打ちと王手だけ
+        6. SEE が負の駒取り
+        各段階の並べ替えは前の段階を使い切ってから行うので、早く beta カットしたノードは
+        打つ手の順序付けをしない。cshogi は合法手を一度に生成するので、段階化するのは
+        Python 側の仕分けと順序付け。
+        """
+        cb = self._cb
+        # 置換表・読み筋の手は同じ局面で生成された手なので is_legal の確認だけで使う
+        if first_move and cb.is_legal(first_move):
+            yield first_move
+        else:
+            first_move = 0
+
+        tactical, quiets, drops = [], [], []
         for m in cb.legal_moves:
-            if cshogi.move_is_drop(m):
-                continue
-            to_sq = cshogi.move_to(m)
-            if cb.piece(to_sq) == 0:
+            if m == first_move:
                 continue
-            usi = cshogi.move_to_usi(m)
-            d = parse_usi_string(usi)
-            d["to"] = tuple(d["to"])
-            d["from"] = tuple(d["from"])
-            captures.append(d)
-        return captures
+            if (m >> MOVE_FROM_SHIFT) & MOVE_SQ_MASK >= 81:
+                drops.append(m)
+            elif (m >> MOVE_CAPTURE_SHIFT) & 15 or m & MOVE_PROMOTE_BIT:
+                tactical.append(m)
+            else:
+                quiets.append(m)
+
+        rand = self._rng.random
+        losing = []
+        if tactical:
+            scored = []
+            for m in tactical:
+                # 取る駒より高い駒で取る手だけ SEE で損得を確かめ、損なら最後に回す
+                if USE_SEE and (m >> MOVE_CAPTURE_SHIFT) & 15 and \
+                        PIECE_TYPE_VALUES[(m >> MOVE_PIECE_SHIFT) & 15] > \
+                        PIECE_TYPE_VALUES[(m >> MOVE_CAPTURE_SHIFT) & 15] and self._see(m) < 0:
+                    losing.append(m)
+                else:
+                    scored.append((self._score_move(m, owner) + rand(), m))
+            scored.sort(reverse=True)
+            for _, m in scored:
+                yield m
+
+        # キラー手・カウンター手は別の局面で記録した手なので、合法手に含まれるものだけ使う
+        color = 1 if owner == GOTE else 0
+        prev = self._undo_moves[ply - 1] if ply > 0 else 0  # 0 = 初手 or ヌルムーブの直後
+        counter = self._counter_moves[_history_index(prev, color ^ 1)] if prev else 0
+        special = []
+        for m in (*self._killers[ply], counter):
+            if m and m != first_move and m not in special and (m in quiets or m in drops):
+                special.append(m)
+                yield m
+
+        history = self._history
+        base = color * HISTORY_PIECES * 81
+        if quiets:
+            scored = [(history[base + ((m >> MOVE_PIECE_SHIFT) & 15) * 81 + (m & MOVE_SQ_MASK)] + rand(), m)
+                      for m in quiets if m not in special]
+            scored.sort(reverse=True)
+            for _, m in scored:
+                yield m
+        # 他に手がないノードで打ちを全て捨てると詰みと誤認するので、その場合は絞らない
+        if drops and prune_drops and (first_move or tactical or quiets):
+            relevant = self._drop_candidate_squares(color)
+            checks = set(cb.check_moves)  # 遠くからの王手（飛角香打ち）も残す
+            kept = [m for m in drops if relevant[SQ_TO_INDEX[m & MOVE_SQ_MASK]] or m in checks or m in special]
+            self._drops_pruned += len(drops) - len(kept)
+            drops = kept
+        if drops:
+            scored = [(self._score_move(m, owner) + rand() +
+                       history[base + (((m >> MOVE_FROM_SHIFT) & MOVE_SQ_MASK) - 66) * 81 + (m & MOVE_SQ_MASK)], m)
+                      for m in drops if m not in special]
+            scored.sort(reverse=True)
+            for _, m in scored:
+                yield m
+
+        if losing:
+            scored = sorted(((self._score_move(m, owner) + rand(), m) for m in losing), reverse=True)
+            for _, m in scored:
+                yield m
+
+    def _record_cutoff(self, move, ply, depth, color, quiets_tried):
+        """静かな手で beta カットしたとき、キラー手・history・カウンター手を更新する。
+
+        quiets_tried はカットまでに読んだ（カットしなかった）静かな手で、history を減点する。
+        """
+        killers = self._killers[ply]
+        if killers[0] != move:
+            killers[1] = killers[0]
+            killers[0] = move
+        prev = self._undo_moves[ply - 1] if ply > 0 else 0
+        if prev:
+            self._counter_moves[_history_index(prev, color ^ 1)] = move
+
+        history = self._history
+        bonus = depth * depth
+        history[_history_index(move, color)] += bonus
+        for m in quiets_tried:
+            idx = _history_index(m, color)
+            history[idx] = max(0, history[idx] - bonus)
+        if history[_history_index(move, color)] > HISTORY_MAX:
+            self._history = [v // 2 for v in history]
+
+    def _generate_captures(self, owner):
+        """指定 owner の駒取りの手だけを cshogi の整数 move で列挙する。"""
+        cb = self._get_cb(owner)
+        return [m for m in cb.legal_moves if cshogi.move_cap(m)]
 
     def _quiescence_search(self, alpha, beta, maximizing, depth):
         """静止探索: 駒取りの手だけを追加探索して交換を正確に評価"""
-        stand_pat = self.evaluate_board()
+        self._qnodes += 1
+        stand_pat = self.evaluate_lazy(alpha, beta) if USE_LAZY_EVAL else self._static_eval()
         if depth <= 0:
             return stand_pat
 
@@ -1043,9 +1804,21 @@ class ShogiGame:
 
         captures = self._order_moves(self._generate_captures(owner), owner)
         for move in captures:
-            undo = self._apply_move(move, owner)
+            piece_type = (move >> MOVE_PIECE_SHIFT) & 15
+            captured = (move >> MOVE_CAPTURE_SHIFT) & 15
+            # デルタ枝刈り: この駒を取っても窓に届かない
+            if USE_DELTA_PRUNING:
+                gain = CAPTURE_GAINS[captured] + DELTA_MARGIN
+                if move & MOVE_PROMOTE_BIT:
+                    gain += PROMOTION_GAINS[piece_type]
+                if (stand_pat + gain <= alpha) if maximizing else (stand_pat - gain >= beta):
+                    continue
+            # SEE: 取り返されて駒損になる取り合いは読まない
+            if USE_SEE and PIECE_TYPE_VALUES[piece_type] > PIECE_TYPE_VALUES[captured] and self._see(move) < 0:
+                continue
+            self._apply_move(move)
             eval_score = self._quiescence_search(alpha, beta, not maximizing, depth - 1)
-            self._undo_move(undo)
+            self._undo_move()
 
             if maximizing:
                 if eval_score >= beta:
@@ -1059,17 +1832,63 @@ class ShogiGame:
                     beta = eval_score
         return alpha if maximizing else beta
 
+    def set_position_history(self, hashes):
+        """対局の過去の局面ハッシュ（cshogi の zobrist_hash、現局面は含まない）を渡す。
+
+        探索でこれらの局面に戻る手は千日手として評価する。
+        """
+        self._position_history = list(hashes)
+
+    def position_hash(self):
+        """現局面の cshogi zobrist_hash（set_position_history に渡す値）"""
+        return self._get_cb(self.turn).zobrist_hash()
+
+    def _repetition_score(self, ply, maximizing):
+        """ply の局面が千日手なら評価値を返す。千日手でなければ None。
+
+        探索経路上の同じ局面まで遡り、その間ずっと片方が王手をかけ続けていれば
+        かけ続けた側の負け、そうでなければ引き分け。経路上になく対局の過去の局面と
+        同じなら引き分け。ヌルムーブを挟んだ経路は千日手とみなさない。
+        """
+        key = self._hash_stack[ply]
+        for q in range(ply - 1, -1, -1):
+            if self._undo_moves[q] == 0:
+                return None
+            if self._hash_stack[q] == key:
+                # q+1, q+3, ... は手番側が王手をかけた局面、q+2, q+4, ..., ply は相手が王手をかけた局面
+                checks = self._check_stack
+                checked_by_us = all(checks[r] for r in range(q + 1, ply, 2))
+                checked_by_them = self._cb.is_check() and all(checks[r] for r in range(q + 2, ply, 2))
+                if checked_by_us == checked_by_them:
+                    return DRAW_SCORE
+                we_win = checked_by_them
+                return PERPETUAL_CHECK_SCORE if we_win == maximizing else -PERPETUAL_CHECK_SCORE
+        return DRAW_SCORE
+
     def _is_time_up(self):
-        """制限時間チェック（100ノードごとに判定して負荷を軽減）"""
+        """制限時間（ハードリミット）とノード数の上限のチェック（時計は100ノードごとに見て負荷を軽減）"""
+        if self._nodes_searched >= self._node_budget:
+            self._search_aborted = True
+            return True
         if self._nodes_searched % 100 == 0:
-            if time.time() - self._search_start_time >= self._search_time_limit:
+            if time.time() >= self._search_deadline:
+                self._search_aborted = True
+                return True
+            if self._stop_event is not None and self._stop_event.is_set():
                 self._search_aborted = True
                 return True
         return self._search_aborted
 
     def minimax(self, game_state, depth, alpha, beta, maximizing):
-        """強化版minimax: undo/redo方式 + 手の順序付け + 静止探索 + 王手延長 + 時間制限"""
+        """強化版minimax: undo/redo方式 + 手の順序付け + 静止探索 + 王手延長 + 時間制限
+
+        PVS: 1手目だけ通常の窓で読み、2手目以降は null window で「1手目より良いか」だけを
+        調べて、良かった手だけ通常の窓で読み直す。
+        """
         self._nodes_searched += 1
+        ply = game_state._ply
+        pv = self._pv
+        pv[ply] = []
 
         # 時間切れチェック
         if self._is_time_up():
@@ -1080,14 +1899,38 @@ class ShogiGame:
         # one-shot resync of cb at root call (recursion preserves invariant via push/pop).
         if not game_state._cb_synced_for(current_turn):
             game_state._cb = game_state._to_cshogi_board(override_turn=current_turn)
-        legal_moves = game_state.get_legal_moves(current_turn)
 
-        # 合法手なし = 詰み
-        if not legal_moves:
-            return (-99999 + (CPU_DEPTH - depth) if maximizing else 99999 - (CPU_DEPTH - depth)), None
+        # 千日手: 探索経路上か対局の過去に同じ局面がある
+        if USE_REPETITION and ply > 0 and game_state._repetitions.get(game_state._hash_stack[ply], 0) > 1:
+            score = game_state._repetition_score(ply, maximizing)
+            if score is not None:
+                return score, None
+
+        # 置換表の参照: 十分な深さのエントリならバウンドに応じてカット、そうでなくても最善手を順序付けに使う
+        tt = self._tt if depth > 0 else None
+        hash_move = None
+        if tt is not None:
+            tt_key = game_state._cb.zobrist_hash()
+            entry = tt.probe(tt_key)
+            self._tt_probes += 1
+            if entry is not None:
+                self._tt_hits += 1
+                tt_depth, tt_bound, tt_score, hash_move = entry
+                if tt_depth >= depth and hash_move is not None:
+                    if tt_bound == TT_EXACT or \
+                            (tt_bound == TT_LOWER and tt_score >= beta) or \
+                            (tt_bound == TT_UPPER and tt_score <= alpha):
+                        if tt_bound == TT_EXACT:
+                            pv[ply] = [hash_move]
+                        return tt_score, hash_move
+            alpha_orig, beta_orig = alpha, beta
+
+        mate_score = -99999 + (CPU_DEPTH - depth) if maximizing else 99999 - (CPU_DEPTH - depth)
 
         # 深度0: 王手延長 or 静止探索
         if depth <= 0:
+            if game_state._cb.is_game_over():  # 合法手なし = 詰み
+                return mate_score, None
             is_in_check = game_state.is_king_in_check(current_turn)
             if is_in_check and depth == 0:
                 depth = 1  # 王手延長: 1手だけ追加探索
@@ -1095,17 +1938,103 @@ class ShogiGame:
                 # 静止探索で駒取りの交換を正確に評価
                 return game_state._quiescence_search(alpha, beta, maximizing, QUIESCENCE_DEPTH), None
 
-        # 手の順序付け（alpha-beta枝刈りの効率化）
-        ordered_moves = game_state._order_moves(legal_moves, current_turn)
+        # 選択的探索: PV ノード・王手中・ルートでは枝刈りしない
+        in_check = game_state._cb.is_check()
+        game_state._check_stack[ply] = in_check
+        is_pv = beta - alpha > PVS_NULL_WINDOW
+        futility = None
+        if not is_pv and not in_check and ply > 0:
+            static_eval = game_state._static_eval()
+
+            # レイザリング: 静的評価が窓を大きく外れていれば、静止探索で確かめて打ち切る
+            if USE_RAZORING and depth <= RAZOR_DEPTH:
+                margin = RAZOR_MARGIN * depth
+                if maximizing and static_eval + margin <= alpha:
+                    value = game_state._quiescence_search(alpha, alpha + PVS_NULL_WINDOW, True, QUIESCENCE_DEPTH)
+                    if value <= alpha:
+                        return value, None
+                elif not maximizing and static_eval - margin >= beta:
+                    value = game_state._quiescence_search(beta - PVS_NULL_WINDOW, beta, False, QUIESCENCE_DEPTH)
+                    if value >= beta:
+                        return value, None
+
+            # ヌルムーブ: 1手パスしても窓の外なら、実際に指せばなおさら外とみなす（連続パスはしない）
+            if USE_NULL_MOVE and depth >= NULL_MOVE_MIN_DEPTH and game_state._undo_moves[ply - 1] and \
+                    (static_eval >= beta if maximizing else static_eval <= alpha):
+                self._follow_pv = False
+                reduced = max(0, depth - 1 - NULL_MOVE_REDUCTION)
+                game_state._apply_null_move()
+                if maximizing:
+                    value, _ = self.minimax(game_state, reduced, beta - PVS_NULL_WINDOW, beta, False)
+                else:
+                    value, _ = self.minimax(game_state, reduced, alpha, alpha + PVS_NULL_WINDOW, True)
+                game_state._undo_null_move()
+                if self._search_aborted:
+                    return value, None
+                if (value >= beta if maximizing else value <= alpha) and abs(value) < 90000:
+                    return value, None
+
+            # フューチリティ: 静的評価 + マージンでも窓に届かないなら、静かな手は読まない
+            if USE_FUTILITY and depth < len(FUTILITY_MARGINS):
+                margin = FUTILITY_MARGINS[depth]
+                if maximizing and static_eval + margin <= alpha:
+                    futility = static_eval + margin
+                elif not maximizing and static_eval - margin >= beta:
+                    futility = static_eval - margin
+
+        # 前回の反復の読み筋をたどっている間は、その手を置換表の手より優先して最初に読む
+        pv_move = None
+        if self._follow_pv and ply < len(self._prev_pv):
+            pv_move = self._prev_pv[ply]
+
+        # 手の順序付け（alpha-beta枝刈りの効率化）: 段階的に生成し、カットしたら残りは並べない
+        ordered_moves = game_state._pick_moves(current_turn, ply, pv_move or hash_move,
+                                               USE_DROP_PRUNING and not is_pv and not in_check and ply > 0)
+        color = 1 if maximizing else 0
+        quiets_tried = []
+        killers = self._killers[ply]
 
         best_move = None
         best_eval = -float('inf') if maximizing else float('inf')
         sign = 1 if maximizing else -1
 
-        for move in ordered_moves:
-            undo = game_state._apply_move(move, current_turn)
-            eval_score, _ = self.minimax(game_state, depth - 1, alpha, beta, not maximizing)
-            game_state._undo_move(undo)
+        for i, move in enumerate(ordered_moves):
+            is_quiet = not (move >> MOVE_CAPTURE_SHIFT) & 15 and not move & MOVE_PROMOTE_BIT
+            self._follow_pv = pv_move is not None and move == pv_move
+            game_state._apply_move(move)
+            gives_check = game_state._cb.is_check()
+
+            if futility is not None and i > 0 and is_quiet and not gives_check:
+                game_state._undo_move()
+                if (futility - best_eval) * sign > 0:
+                    best_eval = futility
+                continue
+
+            self._moves_searched += 1
+            if i == 0:
+                self._expanded_nodes += 1
+
+            # LMR: 順序付けで後ろに回った静かな手は浅く読み、窓を超えたときだけ元の深さで読み直す
+            reduction = 0
+            if USE_LMR and i >= LMR_FULL_MOVES and depth >= LMR_MIN_DEPTH and is_quiet and \
+                    not in_check and not gives_check and move != killers[0] and move != killers[1]:
+                reduction = min(1 if i < LMR_DEEP_MOVES else 2, depth - 2)
+
+            if i == 0:
+                eval_score, _ = self.minimax(game_state, depth - 1, alpha, beta, not maximizing)
+            elif maximizing:
+                eval_score, _ = self.minimax(game_state, depth - 1 - reduction, alpha, alpha + PVS_NULL_WINDOW, False)
+                if reduction and eval_score > alpha and not self._search_aborted:
+                    eval_score, _ = self.minimax(game_state, depth - 1, alpha, alpha + PVS_NULL_WINDOW, False)
+                if alpha + PVS_NULL_WINDOW <= eval_score < beta and not self._search_aborted:
+                    eval_score, _ = self.minimax(game_state, depth - 1, alpha, beta, False)
+            else:
+                eval_score, _ = self.minimax(game_state, depth - 1 - reduction, beta - PVS_NULL_WINDOW, beta, True)
+                if reduction and eval_score < beta and not self._search_aborted:
+                    eval_score, _ = self.minimax(game_state, depth - 1, beta - PVS_NULL_WINDOW, beta, True)
+                if alpha < eval_score <= beta - PVS_NULL_WINDOW and not self._search_aborted:
+                    eval_score, _ = self.minimax(game_state, depth - 1, alpha, beta, True)
+            game_state._undo_move()
 
             if self._search_aborted:
                 if best_move is None:
@@ -1117,58 +2046,313 @@ class ShogiGame:
             if (eval_score - best_eval) * sign > 0:
                 best_eval = eval_score
                 best_move = move
+                if alpha < eval_score < beta:
+                    pv[ply] = [move] + pv[ply + 1]
+                if ply == 0 and (eval_score > alpha if maximizing else eval_score < beta):
+                    self._root_best = (eval_score, move)
 
             if maximizing:
                 alpha = max(alpha, eval_score)
             else:
                 beta = min(beta, eval_score)
             if beta <= alpha:
+                self._cutoffs += 1
+                if i == 0:
+                    self._first_move_cutoffs += 1
+                if is_quiet:
+                    self._record_cutoff(move, ply, depth, color, quiets_tried)
                 break
+            if is_quiet:
+                quiets_tried.append(move)
+
+        # 合法手なし = 詰み
+        if best_move is None:
+            return mate_score, None
+
+        if tt is not None:
+            if best_eval >= beta_orig:
+                bound = TT_LOWER
+            elif best_eval <= alpha_orig:
+                bound = TT_UPPER
+            else:
+                bound = TT_EXACT
+            tt.store(tt_key, depth, bound, best_eval, best_move)
 
         return best_eval, best_move
 
-    def iterative_deepening(self, maximizing, time_limit=None):
-        """反復深化: 制限時間内で可能な限り深く探索する"""
+    def _start_search(self, time_limit=None, node_limit=None):
+        """探索開始時の共通処理（制限時間の設定・置換表の準備）
+
+        node_limit を指定して time_limit を省略すると、時間では打ち切らない。
+        """
         if time_limit is not None:
             self._search_time_limit = time_limit
+        elif node_limit is not None:
+            self._search_time_limit = float('inf')
         else:
             self._search_time_limit = CPU_TIME_LIMIT
+        self._node_limit = node_limit
+        self._node_budget = float('inf') if node_limit is None else node_limit
         self._search_start_time = time.time()
+        self._search_deadline = self._search_start_time + self._search_time_limit
         self._search_aborted = False
+        self._root_best = None
+        if self._tt is None:
+            self._tt = TranspositionTable()
+        self._tt.new_search()
+        if self._eval_cache is None and USE_EVAL_CACHE:
+            self._eval_cache = EvalCache()
+        # 千日手の出現回数: 対局の過去の局面 + ルート局面（探索中は _apply_move/_undo_move が増減する）
+        repetitions = {}
+        for key in self._position_history:
+            repetitions[key] = repetitions.get(key, 0) + 1
+        root_key = self._cb.zobrist_hash()
+        self._hash_stack[self._ply] = root_key
+        repetitions[root_key] = repetitions.get(root_key, 0) + 1
+        self._repetitions = repetitions
+        self._prev_pv = []
+        self._follow_pv = False
+        # キラー手・カウンター手は局面ごとに意味が変わるので消し、history は傾向だけ残す
+        self._killers = [[0, 0] for _ in range(MAX_PLY + 1)]
+        self._counter_moves = [0] * HISTORY_SIZE
+        self._history = [v // 4 for v in self._history]
+
+    def _mate_search(self, maximizing):
+        """df-pn で手番側の詰みを探す。詰めば (評価値, 初手) を返し、詰み手順を読み筋に残す。"""
+        cb = self._cb
+        if (cb.turn == cshogi.WHITE) != maximizing:
+            return None
+        if self._node_limit is None:
+            budget = min(MATE_SEARCH_MAX_TIME, self._search_time_limit * MATE_SEARCH_TIME_RATIO)
+            solver = DfPnSolver(max_nodes=MATE_SEARCH_NODES)
+        else:
+            # ノード数で打ち切る探索では結果が時計に左右されないように、詰み探索もノード数だけで打ち切る
+            budget = None
+            # 詰み探索の局面数は node_limit から差し引くので、通常探索の分が残るように一定の割合だけ渡す
+            solver = DfPnSolver(max_nodes=max(1, min(MATE_SEARCH_NODES,
+                                                     int(self._node_limit * MATE_SEARCH_NODE_RATIO))))
+        moves = solver.solve(cb, time_limit=budget)
+        self._mate_nodes = solver.nodes
+        logger.info("Mate search: %s, nodes=%d, time=%.2fs%s",
+                    solver.result, solver.nodes, time.time() - self._search_start_time,
+                    ", pv=" + " ".join(cshogi.move_to_usi(m) for m in moves) if moves else "")
+        if not moves:
+            return None
+        self._prev_pv = moves
+        val = 99999 - len(moves) if maximizing else -99999 + len(moves)
+        return val, moves[0]
+
+    def _record_iteration(self, depth, started, val, move):
+        """反復1回分の統計を記録し、全反復の合計に足す。"""
+        totals = self._stat_totals
+        for key in STAT_TOTAL_KEYS:
+            totals[key] += getattr(self, "_" + key)
+        cache = self._eval_cache
+        totals["shelter_hits"] += self._shelter.hits
+        totals["shelter_probes"] += self._shelter.probes
+        if cache is not None:
+            totals["eval_cache_hits"] += cache.hits
+            totals["eval_cache_probes"] += cache.hits + cache.misses
+            totals["eval_cache_misses"] += cache.misses
+            totals["eval_cache_evictions"] += cache.evictions
+        completed = not self._search_aborted
+        self._iteration_stats.append({
+            "depth": depth,
+            "completed": completed,
+            "nodes": self._nodes_searched,
+            "qnodes": self._qnodes,
+            "time": round(time.time() - started, 4),
+            "branching": round(self._moves_searched / max(1, self._expanded_nodes), 2),
+            "first_move_cutoff_rate": round(self._first_move_cutoffs / max(1, self._cutoffs), 3),
+            "drops_pruned": self._drops_pruned,
+            "val": val if completed else None,
+            "move": cshogi.move_to_usi(move) if completed and move else None,
+        })
+
+    def _set_search_stats(self, source, started, depth, val, move):
+        """探索全体の統計を search_stats にまとめる。source は "search" / "book" / "mate"。"""
+        totals = self._stat_totals
+        elapsed = time.time() - started
+        nodes = totals["nodes_searched"]
+        qnodes = totals["qnodes"]
+
+        def rate(hits, probes):
+            return round(hits / probes, 3) if probes else None
+
+        self.search_stats = {
+            "source": source,
+            "depth": depth,
+            "val": val,
+            "move": cshogi.move_to_usi(move) if move else None,
+            "nodes": nodes,
+            "qnodes": qnodes,
+            "mate_nodes": self._mate_nodes,
+            "time": round(elapsed, 4),
+            "nps": int((nodes + qnodes) / elapsed) if elapsed > 0 else 0,
+            "branching": rate(totals["moves_searched"], totals["expanded_nodes"]),
+            "first_move_cutoff_rate": rate(totals["first_move_cutoffs"], totals["cutoffs"]),
+            "drops_pruned": totals["drops_pruned"],
+            "tt_hit_rate": rate(totals["tt_hits"], totals["tt_probes"]),
+            "eval_cache_hit_rate": rate(totals["eval_cache_hits"], totals["eval_cache_probes"]),
+            "eval_cache_misses": totals["eval_cache_misses"],
+            "eval_cache_evictions": totals["eval_cache_evictions"],
+            "shelter_hit_rate": rate(totals["shelter_hits"], totals["shelter_probes"]),
+            "lazy_eval_rate": rate(totals["lazy_skips"], totals["lazy_evals"]),
+            "iterations": self._iteration_stats,
+        }
+
+    def iterative_deepening(self, maximizing, time_limit=None, max_depth=None, soft_limit=None,
+                            node_limit=None, seed=None):
+        """反復深化: 制限時間内で可能な限り深く探索する。
+
+        最善手は cshogi の整数 move で返す（API 応答には move_to_dict で変換する）。
+        max_depth を省略すると、読む深さは時間（node_limit ならノード数）の予算で決まる（CPU_DEPTH は安全上限）。
+        time_limit はハードリミット、soft_limit は次の深さを読み始めてよい経過時間の目安
+        （省略時は time_limit × TIME_SOFT_RATIO）。
+        node_limit を指定すると探索ノード数（通常探索のノードの全反復の合計と、詰み探索の局面数）で打ち切り、
+        seed も指定すれば、time_limit に先に達しない限り同じ局面からは常に同じ結果になる。
+        """
+        started = time.time()
+        self._iteration_stats = []
+        self._stat_totals = dict.fromkeys(STAT_TOTAL_KEYS + STAT_CACHE_KEYS, 0)
+        self._mate_nodes = 0
+        if seed is not None:
+            self._rng.seed(seed)
+        book = self._opening_book
+        if book is not None and (self._cb.turn == cshogi.WHITE) == maximizing:
+            move = book.choose(self._cb, self._rng)
+            if move:
+                logger.info("Book move: %s", cshogi.move_to_usi(move))
+                self._set_search_stats("book", started, 0, 0, move)
+                return 0, move
+
+        self._start_search(time_limit, node_limit)
+        if USE_MATE_SEARCH:
+            mate = self._mate_search(maximizing)
+            if mate is not None:
+                self._set_search_stats("mate", started, 0, *mate)
+                return mate
 
         best_move = None
         best_val = 0
         reached_depth = 0
-
-        for depth in range(1, CPU_DEPTH + 1):
+        if soft_limit is None:
+            soft_limit = self._search_time_limit * TIME_SOFT_RATIO
+        stable_iterations = 0
+        prev_nodes = 0
+        # ノード数で打ち切る探索では、詰み探索で使った局面数も node_limit から差し引く
+        total_nodes = self._mate_nodes if node_limit is not None else 0
+
+        for depth in range(1, (max_depth or CPU_DEPTH) + 1):
+            self._root_best = None
             self._nodes_searched = 0
+            if node_limit is not None:
+                self._node_budget = node_limit - total_nodes
+            self._cutoffs = 0
+            self._first_move_cutoffs = 0
+            self._moves_searched = 0
+            self._expanded_nodes = 0
+            self._drops_pruned = 0
+            self._lazy_evals = 0
+            self._lazy_skips = 0
+            self._qnodes = 0
+            self._tt_probes = self._tt_hits = 0
+            self._shelter.hits = self._shelter.probes = 0
+            cache = self._eval_cache
+            if cache is not None:
+                cache.hits = cache.misses = cache.evictions = 0
             self._search_aborted = False
-
-            val, move = self.minimax(self, depth, -float('inf'), float('inf'), maximizing)
+            iteration_start = time.time()
+
+            # アスピレーション窓: 前回の評価値の周辺だけを読み、外れたら窓を広げて読み直す
+            alpha, beta = -float('inf'), float('inf')
+            delta = ASPIRATION_WINDOW
+            if reached_depth > 0 and abs(best_val) < 90000:
+                alpha, beta = best_val - delta, best_val + delta
+            while True:
+                self._follow_pv = True
+                val, move = self.minimax(self, depth, alpha, beta, maximizing)
+                if self._search_aborted:
+                    break
+                if val <= alpha:
+                    delta *= 4
+                    alpha = best_val - delta if delta <= ASPIRATION_WINDOW * 16 else -float('inf')
+                elif val >= beta:
+                    delta *= 4
+                    beta = best_val + delta if delta <= ASPIRATION_WINDOW * 16 else float('inf')
+                else:
+                    break
+            self._record_iteration(depth, iteration_start, val, move)
 
             if self._search_aborted:
                 elapsed = time.time() - self._search_start_time
-                logger.info("Depth %d: TIME UP (%.1fs, %d nodes) - using depth %d result",
-                            depth, elapsed, self._nodes_searched, reached_depth)
+                # 途中まででも、この深さで読み終えたルートの手（1手目か、1手目より良いと分かった手）があればそれを使う
+                partial = self._root_best
+                if partial is not None:
+                    best_val, best_move = partial
+                    logger.info("Depth %d: TIME UP (%.1fs, %d nodes) - using partial depth %d result: "
+                                "val=%s, move=%s", depth, elapsed, self._nodes_searched, depth,
+                                best_val, cshogi.move_to_usi(best_move))
+                else:
+                    logger.info("Depth %d: TIME UP (%.1fs, %d nodes) - using depth %d result",
+                                depth, elapsed, self._nodes_searched, reached_depth)
                 break
 
+            prev_val = best_val
+            stable_iterations = stable_iterations + 1 if move == best_move else 0
             best_val = val
             best_move = move
             reached_depth = depth
+            self._prev_pv = self._pv[self._ply]
             elapsed = time.time() - self._search_start_time
-            logger.info("Depth %d: val=%s, move=%s, time=%.1fs, nodes=%d",
-                        depth, val, move, elapsed, self._nodes_searched)
+            logger.info("Depth %d: val=%s, move=%s, time=%.1fs, nodes=%d, first-move cutoffs=%.0f%%, "
+                        "branching=%.2f, drops pruned=%d, pv=%s",
+                        depth, val, cshogi.move_to_usi(move) if move else None,
+                        elapsed, self._nodes_searched,
+                        100.0 * self._first_move_cutoffs / max(1, self._cutoffs),
+                        self._moves_searched / max(1, self._expanded_nodes), self._drops_pruned,
+                        " ".join(cshogi.move_to_usi(m) for m in self._prev_pv))
+            logger.info("Depth %d eval: lazy=%.0f%% (margin %d), shelter hits=%.0f%%, "
+                        "eval cache hits=%d misses=%d evictions=%d",
+                        depth, 100.0 * self._lazy_skips / max(1, self._lazy_evals), self._lazy_margin,
+                        100.0 * self._shelter.hits / max(1, self._shelter.probes),
+                        cache.hits if cache else 0, cache.misses if cache else 0,
+                        cache.evictions if cache else 0)
 
             if abs(val) > 90000:
                 logger.info("Mate found at depth %d!", depth)
                 break
 
+            # 次の深さのノード数 = このノード数 × 分岐数
+            branching = max(TIME_MIN_BRANCHING, self._nodes_searched / prev_nodes) if prev_nodes \
+                else TIME_DEFAULT_BRANCHING
+            prev_nodes = max(1, self._nodes_searched)
+            total_nodes += self._nodes_searched
+            predicted_nodes = prev_nodes * branching
+            if node_limit is not None:
+                # ノード数で打ち切る探索は時計を見ずに決める（time_limit はハードリミットとしてだけ効く）
+                if predicted_nodes > node_limit - total_nodes:
+                    logger.info("Stopping before depth %d: predicted nodes=%d, nodes=%d, node limit=%d",
+                                depth + 1, predicted_nodes, total_nodes, node_limit)
+                    break
+                continue
+
+            # 時間管理: 最善手が安定していれば早めに切り上げ、評価値が下がったら延長する
+            soft = soft_limit
+            if stable_iterations >= TIME_STABLE_ITERATIONS:
+                soft *= 0.5
+            if depth > 1 and ((prev_val - val) if maximizing else (val - prev_val)) > TIME_SCORE_DROP:
+                soft = min(self._search_time_limit, soft * TIME_EXTEND_FACTOR)
+            # 次の深さの所要時間 = 予測ノード数 / ノード速度
+            predicted = predicted_nodes / max(1.0, total_nodes / max(elapsed, 1e-3))
             remaining = self._search_time_limit - elapsed
-            if remaining < elapsed * 5:
-                logger.info("Stopping: not enough time for depth %d (remaining=%.1fs)",
-                            depth + 1, remaining)
+            if elapsed >= soft or predicted > remaining:
+                logger.info("Stopping before depth %d: elapsed=%.1fs, soft=%.1fs, predicted=%.1fs, "
+                            "remaining=%.1fs, nodes=%d", depth + 1, elapsed, soft, predicted, remaining,
+                            total_nodes)
                 break
 
         logger.info("Final: depth=%d, val=%s, total_time=%.1fs",
                     reached_depth, best_val, time.time() - self._search_start_time)
+        self._set_search_stats("search", started, reached_depth, best_val, best_move)
         return best_val, best_move
@@ -0,0 +1,188 @@
+"""Lazy SMP: 同じ局面を複数プロセスで探索し、置換表を共有メモリで共有する。
+
+GIL があるのでスレッドではなくプロセスを使う。メインワーカー（呼び出し元プロセス）は
+通常どおり反復深化で探索し、ヘルパーは深さの開始位置と手の並び（同点時の乱数）を
+少しずつ変えて同じ局面を読み、結果を共有置換表に書き込むだけにする。
+返すのはメインワーカーの結果で、メインが終わった時点でヘルパーを止める。
+
+    python lazy_smp.py [深さ] [ワーカー数 ...]   # ワーカー数ごとの速度向上を表示
+"""
+import json
+import multiprocessing
+import sys
+import time
+from multiprocessing import shared_memory
+
+from game_logic import ShogiGame, CPU_DEPTH, TT_SIZE_BITS, SMP_WORKERS
+
+SLOT_WORDS = 3  # 1スロット = [key ^ data ^ score_bits, data, score_bits] の 64bit ワード3つ
+
+# data ワードのビット配置: move(32) | depth(8) | bound(2) | generation(8) | 使用中フラグ
+_DEPTH_SHIFT = 32
+_BOUND_SHIFT = 40
+_GEN_SHIFT = 42
+_USED = 1 << 50
+
+
+class SharedTranspositionTable:
+    """multiprocessing.shared_memory 上の置換表（TranspositionTable と同じインターフェース）。
+
+    ロックは取らず、key を data・score と XOR して書き込むことで、別プロセスの書き込みと
+    競合して壊れたスロットは probe 時に key 不一致として捨てる。
+    name を渡すと既存の共有メモリにアタッチする（ヘルパープロセス用）。
+    """
+
+    def __init__(self, size_bits=TT_SIZE_BITS, name=None):
+        size = (1 << size_bits) * SLOT_WORDS * 8
+        if name is None:
+            self.shm = shared_memory.SharedMemory(create=True, size=size)
+        else:
+            self.shm = shared_memory.SharedMemory(name=name)
+        self.name = self.shm.name
+        self.size_bits = size_bits
+        self.words = self.shm.buf.cast("Q")
+        self.mask = (1 << size_bits) - 1
+        self.generation = 0
+        # float <-> 64bit 整数の変換用（score を整数ワードとして XOR するため）
+        self._conv = memoryview(bytearray(8))
+        self._conv_float = self._conv.cast("d")
+        self._conv_bits = self._conv.cast("Q")
+
+    def new_search(self):
+        """探索開始ごとに世代を進め、古いエントリを優先的に置換させる。"""
+        self.generation = (self.generation + 1) & 0xFF
+
+    def probe(self, key):
+        """(depth, bound, score, move) を返す。未登録なら None。"""
+        i = (key & self.mask) * SLOT_WORDS
+        words = self.words
+        data = words[i + 1]
+        score_bits = words[i + 2]
+        if not data or words[i] ^ data ^ score_bits != key:
+            return None
+        self._conv_bits[0] = score_bits
+        return ((data >> _DEPTH_SHIFT) & 0xFF, (data >> _BOUND_SHIFT) & 3,
+                self._conv_float[0], (data & 0xFFFFFFFF) or None)
+
+    def store(self, key, depth, bound, score, move):
+        i = (key & self.mask) * SLOT_WORDS
+        words = self.words
+        old = words[i + 1]
+        if old and words[i] ^ old ^ words[i + 2] != key \
+                and (old >> _GEN_SHIFT) & 0xFF == self.generation \
+                and depth < (old >> _DEPTH_SHIFT) & 0xFF:
+            return
+        data = (move or 0) | depth << _DEPTH_SHIFT | bound << _BOUND_SHIFT | \
+            self.generation << _GEN_SHIFT | _USED
+        self._conv_float[0] = score
+        score_bits = self._conv_bits[0]
+        words[i] = key ^ data ^ score_bits
+        words[i + 1] = data
+        words[i + 2] = score_bits
+
+    def close(self, unlink=False):
+        self.words.release()
+        self.shm.close()
+        if unlink:
+            self.shm.unlink()
+
+
+def _helper_search(sfen, history, maximizing, tt_name, size_bits, worker_id, time_limit, max_depth, stop_event):
+    """ヘルパーワーカー: 停止されるまで同じ局面を読み、共有置換表を埋める。"""
+    game = ShogiGame()
+    game._rng.seed(worker_id)  # fork で親と同じ乱数状態になるので、手の並びをワーカーごとに変える
+    game.from_sfen(sfen)
+    game.set_position_history(history)
+    game._tt = SharedTranspositionTable(size_bits, name=tt_name)
+    game._stop_event = stop_event
+    try:
+        game._start_search(time_limit)
+        # 奇数番のヘルパーは1手深いところから読み始め、メインより1手深くまで読む
+        offset = worker_id % 2
+        for depth in range(1 + offset, max_depth + 1 + offset):
+            game._nodes_searched = 0
+            game.minimax(game, depth, -float('inf'), float('inf'), maximizing)
+            if game._search_aborted:
+                break
+    finally:
+        game._tt.close()
+
+
+def _mp_context():
+    """fork が使える環境では fork（ヘルパーの起動が速い）、それ以外は既定の方式"""
+    if "fork" in multiprocessing.get_all_start_methods():
+        return multiprocessing.get_context("fork")
+    return multiprocessing.get_context()
+
+
+def parallel_search(game, maximizing, workers=SMP_WORKERS, time_limit=None, max_depth=None,
+                    node_limit=None, seed=None):
+    """Lazy SMP で探索し、メインワーカーの (評価値, 最善手) を返す。
+
+    workers はメインを含むプロセス数。1 以下なら game.iterative_deepening と同じ。
+    node_limit を指定したときは結果を再現できるように、workers によらず単一プロセスで探索する。
+    """
+    if workers <= 1 or node_limit is not None:
+        return game.iterative_deepening(maximizing, time_limit=time_limit, max_depth=max_depth,
+                                        node_limit=node_limit, seed=seed)
+
+    ctx = _mp_context()
+    tt = SharedTranspositionTable()
+    stop_event = ctx.Event()
+    sfen = game.get_sfen()
+    helpers = [ctx.Process(target=_helper_search,
+                           args=(sfen, game._position_history, maximizing, tt.name, tt.size_bits,
+                                 worker_id, time_limit, max_depth or CPU_DEPTH, stop_event),
+                           daemon=True)
+               for worker_id in range(1, workers)]
+    saved_tt = game._tt
+    game._tt = tt
+    try:
+        for proc in helpers:
+            proc.start()
+        return game.iterative_deepening(maximizing, time_limit=time_limit, max_depth=max_depth, seed=seed)
+    finally:
+        stop_event.set()
+        for proc in helpers:
+            proc.join(timeout=1.0)
+            if proc.is_alive():
+                proc.terminate()
+                proc.join()
+        game._tt = saved_tt
+        tt.close(unlink=True)
+
+
+BENCH_SFENS = [
+    "lnsgkgsnl/1r5b1/ppppppppp/9/9/9/PPPPPPPPP/1B5R1/LNSGKGSNL b - 1",
+    "lns1kgBnl/r2g5/pppppp1pp/9/9/2P6/PP1PPPPPP/1R7/LNSGKGSNL b BSP 13",
+    "1n2gksnl/l1rs1g3/p1ppp2p1/1p3pp1p/P8/7P1/1PNPPPP1P/1BGS2GRL/L3BKSN1 b p 29",
+    "1n2kgs2/lr1s1g1bl/p3ppn2/1ppp3pp/4PN3/P1P4P1/1P1PGP2P/L3KGR2/1NS3SBL w Pp 44",
+    "l3k2nl/r1+N1gs3/ppnp1p3/4p3p/6P2/1PS1PG1P1/P1NP2S1P/1B7/L1SGKG1RL w B5P 46",
+    "ln1pg1k2/r1+B3s1l/pps2p1p1/5gp1p/P8/1PPP4P/L1S1PP+nP1/1G2K1GRN/B5SNL b 2Pp 57",
+]
+
+
+def benchmark(depth=4, worker_counts=(1, 2, 4), sfens=BENCH_SFENS):
+    """各ワーカー数で固定深さまでの探索時間を測り、1ワーカーに対する速度向上を返す。"""
+    results = []
+    base = None
+    for workers in worker_counts:
+        elapsed = 0.0
+        for sfen in sfens:
+            game = ShogiGame()
+            game.from_sfen(sfen)
+            start = time.perf_counter()
+            parallel_search(game, game.turn == -1, workers=workers, time_limit=3600, max_depth=depth, seed=0)
+            elapsed += time.perf_counter() - start
+        if base is None:
+            base = elapsed
+        results.append({"workers": workers, "time": round(elapsed, 3), "speedup": round(base / elapsed, 2)})
+    return results
+
+
+if __name__ == "__main__":
+    bench_depth = int(sys.argv[1]) if len(sys.argv) > 1 else 4
+    counts = [int(a) for a in sys.argv[2:]] or [1, 2, 4]
+    print(f"cpu_count={multiprocessing.cpu_count()} depth={bench_depth}")
+    for row in benchmark(bench_depth, counts):
+        print(json.dumps(row))
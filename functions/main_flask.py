@@ -3,6 +3,7 @@ import re
 import json
 import sys
 import logging
+import math
 import time
 import traceback
 
@@ -12,7 +13,10 @@ from flask_cors import CORS
 import google.generativeai as genai
 import requests
 
-from game_logic import ShogiGame, SENTE, GOTE, parse_usi_string, to_usi
+from game_logic import (ShogiGame, SENTE, GOTE, SMP_WORKERS, CPU_TIME_LIMIT, DIFFICULTY_NODE_LIMITS,
+                        MAX_DIFFICULTY, parse_usi_string, to_usi, move_to_dict)
+from lazy_smp import parallel_search
+from dfpn import solve_mate
 
 try:
     from openai import OpenAI
@@ -203,6 +207,22 @@ def game_from_request(data):
         game.from_sfen(sfen)
     return game, data 
 
+def parse_position_hashes(values):
+    """リクエストの position_hashes（対局の過去の局面ハッシュ、16進文字列か整数のリスト）を整数のリストにする。"""
+    if values is None:
+        return []
+    if not isinstance(values, list):
+        raise ValueError("position_hashes must be a list")
+    hashes = []
+    for v in values:
+        if isinstance(v, bool):  # True / False も int なので明示的に弾く
+            raise ValueError("position_hashes must not contain booleans")
+        h = v if isinstance(v, int) else int(v, 16)
+        if not 0 <= h < 2 ** 64:  # 局面ハッシュは符号なし64ビット
+            raise ValueError("position hash out of range")
+        hashes.append(h)
+    return hashes
+
 def get_full_state(game, ai_settings=None):
     if ai_settings is None:
         ai_settings = {"ai_vs_ai_mode": False} 
@@ -213,6 +233,7 @@ def get_full_state(game, ai_settings=None):
         'turn': game.turn,
         'game_over': game.game_over,
         'sfen': game.get_sfen(),
+        'position_hash': format(game.position_hash(), '016x'),
         'last_move': game.last_move,
         'vs_ai': game.vs_ai,
         'ai_vs_ai_mode': ai_settings.get('ai_vs_ai_mode') or ai_settings.get('ai_vs_ai', False),
@@ -392,11 +413,41 @@ def cpu_move():
     # Determine if maximizing (Gote) or minimizing (Sente)
     # minimax is designed such that True = Gote (Maximize), False = Sente (Minimize)
     is_maximizing = (game.turn == GOTE)
+
+    # 並列探索のプロセス数（リクエストごとに指定可、CPU数で頭打ち）
+    try:
+        threads = int(req_data.get('threads', SMP_WORKERS))
+    except (TypeError, ValueError):
+        return jsonify({'status': 'error', 'message': 'threads must be an integer'}), 400
+    threads = max(1, min(threads, os.cpu_count() or 1))
+
+    # 対局の過去の局面（千日手の判定用、省略可）
+    try:
+        game.set_position_history(parse_position_hashes(req_data.get('position_hashes')))
+    except (TypeError, ValueError):
+        return jsonify({'status': 'error', 'message': 'position_hashes must be a list of unsigned 64-bit hashes (hex strings or integers)'}), 400
+
+    # 難易度: level（1〜MAX_DIFFICULTY）を探索ノード数の上限に対応させる。nodes で上限を直接指定、
+    # seed で乱数を固定できる（同じ局面・nodes・seed なら同じ手になる）
+    level = req_data.get('level')
+    level = MAX_DIFFICULTY if level is None else level
+    node_limit = req_data.get('nodes')
+    seed = req_data.get('seed')
+    # 1.7 や "3" や true を黙って整数に丸めない（bool も int なので明示的に弾く）
+    if any(not isinstance(v, int) or isinstance(v, bool)
+           for v in (level, node_limit, seed) if v is not None):
+        return jsonify({'status': 'error', 'message': 'level, nodes and seed must be integers'}), 400
+    if node_limit is None:
+        node_limit = DIFFICULTY_NODE_LIMITS.get(level)
+    if not 1 <= level <= MAX_DIFFICULTY or (node_limit is not None and node_limit <= 0):
+        return jsonify({'status': 'error', 'message': f'level must be 1-{MAX_DIFFICULTY} and nodes positive'}), 400
     
     try:
-        logger.info("CPU Thinking (Iterative Deepening)...")
-        best_val, best_move = game.iterative_deepening(is_maximizing)
+        logger.info("CPU Thinking (Iterative Deepening, %d worker(s), level %d)...", threads, level)
+        best_val, best_move = parallel_search(game, is_maximizing, workers=threads,
+                                              time_limit=CPU_TIME_LIMIT, node_limit=node_limit, seed=seed)
         if best_move:
+            best_move = move_to_dict(best_move)
             # Generate JP string BEFORE making move (to see source piece)
             move_str_ja = get_japanese_move_str(game, best_move)
             current_move_count = game.move_count
@@ -415,6 +466,7 @@ def cpu_move():
                 'move': best_move,
                 'move_str_ja': move_str_ja,
                 'move_count': current_move_count,
+                'stats': game.search_stats,
                 'game_state': get_full_state(game, ai_settings=req_data)
             })
         else:
@@ -423,12 +475,51 @@ def cpu_move():
                 'status': 'ok', 
                 'game_over': True, 
                 'winner': 'Sente',
+                'stats': game.search_stats,
                 'game_state': get_full_state(game, ai_settings=req_data)
             }) 
     except Exception as e:
         return jsonify({'status': 'error', 'message': str(e), 'trace': traceback.format_exc()}), 500
 
 
+@app.route('/api/tsume', methods=['POST'])
+def tsume():
+    """詰将棋: SFEN の手番側の詰みを df-pn で探し、詰み手順を返す。"""
+    data = request.json or {}
+    try:
+        game, _ = game_from_request(data)
+    except Exception as e:
+        return jsonify({'status': 'error', 'message': f'Invalid SFEN: {e}'}), 400
+    try:
+        time_limit = float(data.get('time_limit', CPU_TIME_LIMIT))
+        # nan は min() をすり抜けて時間制限が効かなくなり、0 以下はすぐ「不詰」を返してしまう
+        if not math.isfinite(time_limit) or time_limit <= 0:
+            raise ValueError(time_limit)
+    except (TypeError, ValueError):
+        return jsonify({'status': 'error', 'message': 'time_limit must be a positive number'}), 400
+    time_limit = min(time_limit, CPU_TIME_LIMIT)
+
+    start = time.time()
+    usi_moves, solver = solve_mate(game.get_sfen(), time_limit=time_limit)
+    elapsed = time.time() - start
+
+    # 日本語表記は1手ずつ指しながら作る（動かす駒の名前が必要なため）
+    moves_ja = []
+    for usi in usi_moves or []:
+        parsed = parse_usi_string(usi)
+        moves_ja.append(get_japanese_move_str(game, parsed))
+        apply_move(game, parsed, game.turn)
+
+    return jsonify({
+        'status': 'ok',
+        'result': solver.result,
+        'mate': usi_moves is not None,
+        'moves': usi_moves or [],
+        'moves_ja': moves_ja,
+        'nodes': solver.nodes,
+        'time': round(elapsed, 3)
+    })
+
 # ========== LLM Move Helper Functions ==========
 
 def parse_model_name(model_name):
@@ -919,6 +1010,8 @@ def cpu_fallback(game, turn, last_error, tts_enabled, model_name, ai_settings):
         _, best_move = game.iterative_deepening(
             maximizing=(turn == GOTE), time_limit=3.0
         )
+        if best_move:
+            best_move = move_to_dict(best_move)
     except Exception as e:
         logger.warning(f"CPU fallback minimax failed: {e}. Using random move.")
     if not best_move:
@@ -947,6 +1040,7 @@ def cpu_fallback(game, turn, last_error, tts_enabled, model_name, ai_settings):
         'reasoning': reasoning,
         'model': f"{model_name} (Fallback)",
         'fallback_used': True,
+        'stats': game.search_stats,  # 探索が失敗してランダムな手にしたときは None
         'game_state': get_full_state(game, ai_settings)
     }
 
@@ -978,6 +1072,12 @@ def llm_move():
         except Exception as e:
             return jsonify({'status': 'error', 'message': f'Invalid SFEN: {e}'}), 400
 
+        # 対局の過去の局面（CPU フォールバック時の千日手の判定用、省略可）
+        try:
+            game.set_position_history(parse_position_hashes(req_data.get('position_hashes')))
+        except (TypeError, ValueError):
+            return jsonify({'status': 'error', 'message': 'position_hashes must be a list of unsigned 64-bit hashes (hex strings or integers)'}), 400
+
         turn = game.turn
         ai_vs_ai_mode = req_data.get('ai_vs_ai_mode', False) or req_data.get('ai_vs_ai', False)
         sente_model = req_data.get('sente_model', DEFAULT_SENTE_MODEL)
@@ -0,0 +1,226 @@
+"""定跡ファイル: 局面ハッシュ → 重み付きの指し手 を並べたバイナリを mmap で引く。
+
+ファイルはヘッダ (マジック8バイト + 件数) の後に、16バイトのレコード
+(zobrist_hash, move, weight) を局面ハッシュ順に並べたもの。1局面に複数の手が
+あれば隣り合うレコードになる。mmap して二分探索するだけなので、ファイルを
+メモリに読み込まず、インスタンスのメモリ使用量は定跡の大きさによらない。
+
+    python opening_book.py kifu 出力 棋譜ファイル...          # USI / CSA / KIF の棋譜から作る
+    python opening_book.py selfplay 出力 [対局数] [深さ] [手数]  # 自己対局の探索結果から作る
+    python opening_book.py show 定跡ファイル [SFEN]             # 局面の定跡手を表示
+"""
+import mmap
+import os
+import random
+import struct
+import sys
+
+import cshogi
+
+MAGIC = b"SHOGIBK1"
+HEADER = struct.Struct("<8sQ")      # マジック, レコード数
+RECORD = struct.Struct("<QIH2x")    # 局面ハッシュ, move, 重み（16バイト境界に揃える）
+MAX_WEIGHT = 0xFFFF
+BOOK_MAX_PLY = 24  # 棋譜・自己対局から定跡に入れる手数
+SELFPLAY_EXPLORE = 0.2  # 自己対局で、探索の最善手を登録したうえで実際には合法手をランダムに指す確率
+
+
+class OpeningBook:
+    """定跡ファイルを mmap して引く。probe(key) は [(move, 重み), ...] を返す。"""
+
+    def __init__(self, path):
+        self._file = open(path, "rb")
+        try:
+            self._map = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        except ValueError:  # 空ファイルは mmap できない
+            self._file.close()
+            raise ValueError(f"{path}: not an opening book")
+        magic, self.count = HEADER.unpack_from(self._map, 0)
+        if magic != MAGIC or HEADER.size + self.count * RECORD.size > len(self._map):
+            self.close()
+            raise ValueError(f"{path}: not an opening book")
+
+    def _key_at(self, i):
+        return RECORD.unpack_from(self._map, HEADER.size + i * RECORD.size)[0]
+
+    def probe(self, key):
+        lo, hi = 0, self.count
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if self._key_at(mid) < key:
+                lo = mid + 1
+            else:
+                hi = mid
+        moves = []
+        for i in range(lo, self.count):
+            record_key, move, weight = RECORD.unpack_from(self._map, HEADER.size + i * RECORD.size)
+            if record_key != key:
+                break
+            moves.append((move, weight))
+        return moves
+
+    def choose(self, board, rng=random):
+        """board（cshogi.Board）の定跡手を重みに比例した確率で選ぶ。なければ None。
+
+        局面ハッシュの衝突に備えて、合法手に含まれない手は捨てる。
+        """
+        moves = self.probe(board.zobrist_hash())
+        if not moves:
+            return None
+        legal = set(board.legal_moves)
+        moves = [(move, weight) for move, weight in moves if move in legal and weight > 0]
+        if not moves:
+            return None
+        return rng.choices([m for m, _ in moves], weights=[w for _, w in moves])[0]
+
+    def close(self):
+        self._map.close()
+        self._file.close()
+
+
+_books = {}
+
+
+def get_opening_book(path):
+    """定跡ファイルをプロセス内で1度だけ開いて使い回す。ファイルがなければ None。"""
+    if path not in _books:
+        try:
+            _books[path] = OpeningBook(path)
+        except (OSError, ValueError):
+            _books[path] = None
+    return _books[path]
+
+
+def write_book(path, counts):
+    """{局面ハッシュ: {move: 回数}} を定跡ファイルに書く。重みは最大 MAX_WEIGHT に切り詰める。"""
+    records = sorted((key, move, min(count, MAX_WEIGHT))
+                     for key, moves in counts.items() for move, count in moves.items())
+    tmp = path + ".tmp"
+    with open(tmp, "wb") as f:
+        f.write(HEADER.pack(MAGIC, len(records)))
+        for record in records:
+            f.write(RECORD.pack(*record))
+    os.replace(tmp, path)  # 読み込み中のプロセスがあっても壊れたファイルを見せない
+    return len(records)
+
+
+class BookBuilder:
+    """棋譜や自己対局の指し手を局面ごとに数え、write_book に渡す形で貯める。"""
+
+    def __init__(self, max_ply=BOOK_MAX_PLY):
+        self.max_ply = max_ply
+        self.counts = {}
+
+    def add_move(self, board, move):
+        position = self.counts.setdefault(board.zobrist_hash(), {})
+        position[move] = position.get(move, 0) + 1
+
+    def add_game(self, sfen, moves):
+        """開始局面 sfen（None なら平手）から moves（cshogi の move）を max_ply 手まで登録する。"""
+        board = cshogi.Board(sfen) if sfen else cshogi.Board()
+        for move in moves[:self.max_ply]:
+            if not board.is_legal(move):
+                break
+            self.add_move(board, move)
+            board.push(move)
+
+    def add_usi_line(self, line):
+        """'startpos moves 7g7f ...' / 'sfen ... moves ...' / 指し手だけ の1行を1局として登録する。"""
+        tokens = line.split()
+        if tokens and tokens[0] == "position":
+            tokens = tokens[1:]
+        sfen = None
+        if tokens and tokens[0] == "startpos":
+            tokens = tokens[1:]
+        elif tokens and tokens[0] == "sfen":
+            sfen = " ".join(tokens[1:5])
+            tokens = tokens[5:]
+        if tokens and tokens[0] == "moves":
+            tokens = tokens[1:]
+        board = cshogi.Board(sfen) if sfen else cshogi.Board()
+        moves = []
+        for usi in tokens:
+            move = board.move_from_usi(usi)
+            if not move or not board.is_legal(move):
+                break
+            moves.append(move)
+            board.push(move)
+        self.add_game(sfen, moves)
+
+    def add_kifu_file(self, path):
+        """拡張子で形式を判断して棋譜ファイルを読み込む（.csa / .kif / それ以外は USI の行）"""
+        import cshogi.CSA
+        import cshogi.KIF
+        ext = os.path.splitext(path)[1].lower()
+        if ext == ".csa":
+            for kifu in cshogi.CSA.Parser.parse_file(path):
+                self.add_game(kifu.sfen, kifu.moves)
+        elif ext in (".kif", ".kifu"):
+            kifu = cshogi.KIF.Parser.parse_file(path)
+            self.add_game(kifu.sfen, kifu.moves)
+        else:
+            with open(path, encoding="utf-8") as f:
+                for line in f:
+                    line = line.strip()
+                    if line and not line.startswith("#"):
+                        self.add_usi_line(line)
+
+    def add_selfplay(self, games, depth, plies, time_limit=3600, explore=SELFPLAY_EXPLORE):
+        """平手から自己対局し、各局面で探索した最善手を登録する。
+
+        最善手だけを指すと毎局同じ手順になるので、確率 explore で実際にはランダムな
+        合法手を指して局面を散らす（登録するのは常に探索の最善手）。
+        """
+        from game_logic import ShogiGame, GOTE
+        for index in range(games):
+            rng = random.Random(index)
+            game = ShogiGame()
+            game._opening_book = None  # 作りかけの定跡に従わず毎回探索する
+            board = cshogi.Board()
+            for _ in range(min(plies, self.max_ply)):
+                game.from_sfen(board.sfen())
+                _, move = game.iterative_deepening(game.turn == GOTE, time_limit=time_limit, max_depth=depth,
+                                                   seed=rng.getrandbits(32))
+                if not move:
+                    break
+                self.add_move(board, move)
+                if rng.random() < explore:
+                    move = rng.choice(list(board.legal_moves))
+                board.push(move)
+
+    def write(self, path):
+        return write_book(path, self.counts)
+
+
+def main(argv):
+    if len(argv) < 3:
+        print(__doc__)
+        return 1
+    command, path = argv[1], argv[2]
+    if command == "show":
+        book = OpeningBook(path)
+        board = cshogi.Board(argv[3]) if len(argv) > 3 else cshogi.Board()
+        print(f"{book.count} records")
+        for move, weight in book.probe(board.zobrist_hash()):
+            print(cshogi.move_to_usi(move), weight)
+        return 0
+
+    builder = BookBuilder()
+    if command == "kifu":
+        for kifu_path in argv[3:]:
+            builder.add_kifu_file(kifu_path)
+    elif command == "selfplay":
+        games = int(argv[3]) if len(argv) > 3 else 8
+        depth = int(argv[4]) if len(argv) > 4 else 4
+        plies = int(argv[5]) if len(argv) > 5 else 16
+        builder.add_selfplay(games, depth, plies)
+    else:
+        print(__doc__)
+        return 1
+    count = builder.write(path)
+    print(f"{len(builder.counts)} positions, {count} records -> {path}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv))
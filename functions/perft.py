@@ -0,0 +1,180 @@
+"""perft: 指定の深さまでの末端局面の数を数え、指し手生成と make/unmake の正しさと速さを確かめる。
+
+ShogiGame の get_legal_moves（move dict）→ to_usi → _apply_move / _undo_move（探索と同じ経路）で
+局面を進めて戻しながら数え、cshogi だけで数えた値と突き合わせる。末端の1手前では合法手の数を
+そのまま足す（bulk counting）。各局面では、差分更新している盤面（_squares / _hands）から作った
+get_sfen() が self._cb の SFEN と一致するか、move dict の移動元・持ち駒が盤面と合っているか、
+USI との変換が往復で一致するかも確かめる。
+--legacy を付けると、各局面の合法手が従来の幾何判定（is_physically_possible）でも
+指せる手か、指した後に can_capture_king で玉を取られないかも確かめる。
+
+    python perft.py [深さ] [SFEN] [--divide] [--workers N] [--legacy]
+"""
+import argparse
+import multiprocessing
+import sys
+import time
+
+import cshogi
+
+from game_logic import ShogiGame, SENTE, GOTE, HAND_INDEX, parse_usi_string, to_usi
+
+STARTPOS = "lnsgkgsnl/1r5b1/ppppppppp/9/9/9/PPPPPPPPP/1B5R1/LNSGKGSNL b - 1"
+
+
+def perft(game, depth, errors, legacy=False):
+    """game の局面から depth 手先までの末端局面の数。食い違いは errors に文字列で足す。"""
+    moves = _legal_moves(game, errors)
+    if legacy:
+        _check_legacy(game, moves, errors)
+    if depth <= 1:
+        return len(moves) if depth == 1 else 1
+    nodes = 0
+    for move, _ in moves:
+        game._apply_move(move)
+        nodes += perft(game, depth - 1, errors, legacy)
+        game._undo_move()
+    return nodes
+
+
+def _legal_moves(game, errors):
+    """ShogiGame の経路で合法手を作り、[(cshogi の move, move dict), ...] を返す。
+
+    盤面・持ち駒・手番が self._cb と一致するか、move dict が ShogiGame の盤面で指せる形か、
+    to_usi / parse_usi_string の往復で同じ手になるかを確かめる。
+    """
+    sfen = game._cb.sfen()
+    if game.get_sfen().split(" ")[:3] != sfen.split(" ")[:3]:
+        errors.append(f"{sfen}: get_sfen={game.get_sfen()}")
+    owner = game.turn
+    moves = []
+    for d in game.get_legal_moves(owner):
+        usi = to_usi(d)
+        move = game._cb.move_from_usi(usi) if usi else 0
+        if not move or parse_usi_string(usi) != _listed(d):
+            errors.append(f"{sfen} {d}: to_usi={usi}")
+            continue
+        if d["type"] == "move":
+            piece = game.get_piece(*d["from"])
+            target = game.get_piece(*d["to"])
+            ok = piece is not None and piece["owner"] == owner and (target is None or target["owner"] != owner)
+        else:
+            ok = game._hands[0 if owner == SENTE else 1][HAND_INDEX[d["name"]]] > 0 and game.get_piece(*d["to"]) is None
+        if not ok:
+            errors.append(f"{sfen} {usi}: move dict does not match the board")
+        moves.append((move, d))
+    return moves
+
+
+def _listed(d):
+    """move_to_dict のタプル座標を parse_usi_string と同じリストにそろえる"""
+    return {k: list(v) if isinstance(v, tuple) else v for k, v in d.items()}
+
+
+def cshogi_perft(board, depth):
+    """cshogi の push / pop だけで数えた perft（突き合わせ用）"""
+    if depth <= 1:
+        return sum(1 for _ in board.legal_moves) if depth == 1 else 1
+    nodes = 0
+    for move in board.legal_moves:
+        board.push(move)
+        nodes += cshogi_perft(board, depth - 1)
+        board.pop()
+    return nodes
+
+
+def _check_legacy(game, moves, errors):
+    """合法手が従来の判定でも指せる手で、指した後に自玉を取られないかを確かめる。"""
+    owner = SENTE if game._cb.turn == cshogi.BLACK else GOTE
+    for move, d in moves:
+        if d["type"] == "move":
+            possible = game.is_physically_possible("move", d["from"], d["to"], owner, d["promote"])
+        else:
+            possible = game.is_physically_possible("drop", d["name"], d["to"], owner)
+        if not possible:
+            errors.append(f"{game._cb.sfen()} {cshogi.move_to_usi(move)}: is_physically_possible=False")
+        game._apply_move(move)
+        if game.can_capture_king(-owner):
+            errors.append(f"{game._cb.sfen()} after {cshogi.move_to_usi(move)}: can_capture_king=True")
+        game._undo_move()
+
+
+def _divide_task(args):
+    """プロセスプール用: ルートの1手を指した局面の perft と cshogi の perft を、それぞれの所要時間と返す。"""
+    sfen, usi, depth, legacy = args
+    game = ShogiGame()
+    game._opening_book = None
+    game.from_sfen(sfen)
+    move = game._cb.move_from_usi(usi)
+    errors = []
+    start = time.perf_counter()
+    game._apply_move(move)
+    nodes = perft(game, depth - 1, errors, legacy)
+    game_time = time.perf_counter() - start
+    board = cshogi.Board(sfen)
+    start = time.perf_counter()
+    board.push(move)
+    expected = cshogi_perft(board, depth - 1)
+    return usi, nodes, expected, errors, game_time, time.perf_counter() - start
+
+
+def divide(sfen, depth, workers=1, legacy=False):
+    """ルートの手ごとに (usi, 数, cshogi の数, 食い違い, 所要時間, cshogi の所要時間) のリストを返す。
+
+    ルート局面そのものの食い違いは usi を None にした行で返す。
+    """
+    game = ShogiGame()
+    game._opening_book = None
+    game.from_sfen(sfen)
+    errors = []
+    tasks = [(sfen, to_usi(d), depth, legacy) for _, d in _legal_moves(game, errors)]
+    if legacy:
+        _check_legacy(game, _legal_moves(game, []), errors)
+    root = [(None, 0, 0, errors, 0.0, 0.0)] if errors else []
+    if workers > 1 and len(tasks) > 1:
+        with multiprocessing.Pool(workers) as pool:
+            return root + pool.map(_divide_task, tasks, chunksize=1)
+    return root + [_divide_task(task) for task in tasks]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="perft for ShogiGame move generation")
+    parser.add_argument("depth", type=int, nargs="?", default=3)
+    parser.add_argument("sfen", nargs="*", help="局面（省略時は平手）")
+    parser.add_argument("--divide", action="store_true", help="ルートの手ごとの数を表示する")
+    parser.add_argument("--workers", type=int, default=1, help="ルートの手を分けて数えるプロセス数")
+    parser.add_argument("--legacy", action="store_true", help="従来の幾何判定とも突き合わせる（遅い）")
+    args = parser.parse_args(argv)
+    sfen = " ".join(args.sfen) or STARTPOS
+    if args.depth < 1:
+        parser.error("depth must be at least 1")
+
+    start = time.perf_counter()
+    results = divide(sfen, args.depth, max(1, args.workers), args.legacy)
+    elapsed = time.perf_counter() - start
+
+    total = sum(r[1] for r in results)
+    expected = sum(r[2] for r in results)
+    mismatches = [(usi, nodes, count) for usi, nodes, count, *_ in results if nodes != count]
+    errors = [e for r in results for e in r[3]]
+    if args.divide:
+        for usi, nodes, count, *_ in sorted(r for r in results if r[0]):
+            print(f"{usi}: {nodes}" + ("" if nodes == count else f" (cshogi {count})"))
+    # nps はプロセスごとの計算時間の合計で割った1プロセスあたりの値（突き合わせの cshogi の時間は別）
+    game_time = sum(r[4] for r in results)
+    cshogi_time = sum(r[5] for r in results)
+    print(f"depth {args.depth}: {total} nodes, cshogi {expected}, wall {elapsed:.2f}s "
+          f"({max(1, args.workers)} worker(s))")
+    print(f"ShogiGame: {game_time:.2f}s, {int(total / game_time) if game_time > 0 else 0} nps / "
+          f"cshogi: {cshogi_time:.2f}s, {int(expected / cshogi_time) if cshogi_time > 0 else 0} nps")
+    for usi, nodes, count in mismatches:
+        print(f"MISMATCH {usi}: {nodes} != cshogi {count}")
+    for error in errors[:20]:
+        print("ERROR", error)
+    if len(errors) > 20:
+        print(f"ERROR ... {len(errors) - 20} more")
+    return 1 if mismatches or errors else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,32 @@
+import cshogi
+
+from dfpn import DfPnSolver, solve_mate
+
+MATE_IN_3 = "pn3s1kb/1g2+B2p1/l2L1+Rgsl/2p3pPp/P4G2P/2P3P2/NP1S2n2/LpN1K2g1/3S2+pr1 b 2P3p 139"
+NO_MATE = "4k4/9/9/9/9/9/9/9/4K3R b - 1"
+
+
+def test_mate_in_3_replays_to_checkmate():
+    usi_moves, solver = solve_mate(MATE_IN_3)
+    assert solver.result == "mate"
+    assert len(usi_moves) == 3
+    board = cshogi.Board(MATE_IN_3)
+    for i, usi in enumerate(usi_moves):
+        move = board.move_from_usi(usi)
+        assert board.is_legal(move)
+        board.push(move)
+        if i % 2 == 0:
+            assert board.is_check()  # 攻め方の手はすべて王手
+    assert board.is_check() and not list(board.legal_moves)
+
+
+def test_no_mate():
+    usi_moves, solver = solve_mate(NO_MATE)
+    assert usi_moves is None
+    assert solver.result == "nomate"
+
+
+def test_solve_restores_board():
+    board = cshogi.Board(MATE_IN_3)
+    DfPnSolver().solve(board)
+    assert board.sfen() == cshogi.Board(MATE_IN_3).sfen()
@@ -0,0 +1,94 @@
+import itertools
+import random
+import time
+
+import game_logic
+from game_logic import ShogiGame, GOTE
+
+SFEN = "lnsg1g1nl/4k1sb1/p1ppp1ppp/1r3p3/9/P3PP3/2PP2PPP/1BGS3R1/LN2KGSNL b Pp 17"
+
+
+def _search(node_limit):
+    game = ShogiGame()
+    game._opening_book = None
+    game.from_sfen(SFEN)
+    val, move = game.iterative_deepening(game.turn == GOTE, time_limit=game_logic.CPU_TIME_LIMIT,
+                                         node_limit=node_limit, seed=0)
+    return val, move, game.search_stats["depth"], game.search_stats["nodes"]
+
+
+def test_node_limited_search_ignores_slow_clock(monkeypatch):
+    expected = _search(20000)
+
+    # 負荷の高いマシンを模して、呼ぶたびに 0.15 秒進む時計にする
+    # （この探索でソフトリミットは超えるが、ハードリミットには届かない）
+    clock = itertools.count()
+    start = time.time()
+    monkeypatch.setattr(game_logic.time, "time", lambda: start + next(clock) * 0.15)
+
+    assert _search(20000) == expected
+
+
+def _walk(game, usi_moves):
+    """探索と同じように局面を進め、各局面の王手の有無を _check_stack に積む。"""
+    game._start_search(node_limit=1)
+    game._check_stack[game._ply] = game._cb.is_check()
+    for usi in usi_moves:
+        game._apply_move(game._cb.move_from_usi(usi))
+        game._check_stack[game._ply] = game._cb.is_check()
+
+
+def test_repetition_without_checks_is_a_draw():
+    game = ShogiGame()
+    game.from_sfen("4k4/9/9/9/9/9/9/9/4K3R b - 1")
+    _walk(game, ["5i4i", "5a4a", "4i5i", "4a5a"])
+    assert game._repetition_score(game._ply, game.turn == GOTE) == game_logic.DRAW_SCORE
+
+
+def test_perpetual_check_loses_for_the_checker():
+    game = ShogiGame()
+    game.from_sfen("4k4/9/9/9/9/9/9/9/4K3R b - 1")
+    # 先手の飛車が 1a / 1b から王手をかけ続け、5手目で1手目の局面（後手番）に戻る
+    _walk(game, ["1i1a", "5a5b", "1a1b", "5b5a", "1b1a"])
+    assert game.turn == GOTE
+    assert game._repetition_score(game._ply, True) == game_logic.PERPETUAL_CHECK_SCORE
+    assert game._repetition_score(game._ply, False) == -game_logic.PERPETUAL_CHECK_SCORE
+
+
+PARITY_SFENS = [
+    "lnsgkgsnl/1r5b1/ppppppppp/9/9/9/PPPPPPPPP/1B5R1/LNSGKGSNL b - 1",
+    SFEN,
+    "l3k2nl/r1+N1gs3/ppnp1p3/4p3p/6P2/1PS1PG1P1/P1NP2S1P/1B7/L1SGKG1RL w B5P 46",
+    "1k5nl/2g1g4/3p4p/5ps2/8P/5G2L/PPBK2P2/6G2/L1S3SN1 w 2RSNL6Pbn5p 74",
+]
+
+
+def _eval_state(game):
+    """差分更新している評価用の状態（駒リストは順序によらない形にする）"""
+    return (game._psq_score, game._material, list(game._hand_value), list(game._king_sq),
+            list(game._pawn_keys), [sorted(plist) for plist in game._piece_list],
+            bytes(game._squares), [list(h) for h in game._hands], game.turn,
+            game._cb.sfen().split(" ")[:3], game.evaluate_board())
+
+
+def test_incremental_eval_matches_rebuild_and_undo_restores():
+    rng = random.Random(0)
+    for sfen in PARITY_SFENS:
+        game = ShogiGame()
+        game.from_sfen(sfen)
+        before = _eval_state(game) + (game.move_count, game._cb.sfen())
+        for _ in range(30):
+            plies = 0
+            for _ in range(rng.randint(1, 12)):
+                moves = list(game._cb.legal_moves)
+                if not moves:
+                    break
+                game._apply_move(rng.choice(moves))
+                plies += 1
+                # 差分更新した状態が、同じ局面を盤面全体から作り直した状態と一致する
+                rebuilt = ShogiGame()
+                rebuilt.from_sfen(game.get_sfen())
+                assert _eval_state(game) == _eval_state(rebuilt)
+            for _ in range(plies):
+                game._undo_move()
+            assert _eval_state(game) + (game.move_count, game._cb.sfen()) == before
@@ -0,0 +1,39 @@
+import pytest
+
+import main_flask
+from main_flask import parse_position_hashes
+
+STARTPOS = "lnsgkgsnl/1r5b1/ppppppppp/9/9/9/PPPPPPPPP/1B5R1/LNSGKGSNL b - 1"
+MATE_IN_3 = "pn3s1kb/1g2+B2p1/l2L1+Rgsl/2p3pPp/P4G2P/2P3P2/NP1S2n2/LpN1K2g1/3S2+pr1 b 2P3p 139"
+
+
+@pytest.fixture
+def client():
+    return main_flask.app.test_client()
+
+
+def test_parse_position_hashes():
+    assert parse_position_hashes(None) == []
+    assert parse_position_hashes(["ff", 3, "ffffffffffffffff"]) == [255, 3, 2 ** 64 - 1]
+    for bad in ([True], [False], [-1], ["-1"], [2 ** 64], ["zz"], "ff"):
+        with pytest.raises((TypeError, ValueError)):
+            parse_position_hashes(bad)
+
+
+@pytest.mark.parametrize("hashes", [[True], [-1], [2 ** 64], ["not hex"], "ff"])
+def test_cpu_rejects_bad_position_hashes(client, hashes):
+    res = client.post("/api/cpu", json={"sfen": STARTPOS.replace(" b ", " w "), "position_hashes": hashes})
+    assert res.status_code == 400
+
+
+def test_tsume_returns_mate(client):
+    res = client.post("/api/tsume", json={"sfen": MATE_IN_3, "time_limit": 5})
+    assert res.status_code == 200
+    assert res.json["result"] == "mate"
+    assert len(res.json["moves"]) == 3
+
+
+@pytest.mark.parametrize("time_limit", ["nan", "inf", "-inf", "x", 0, -1, None])
+def test_tsume_rejects_bad_time_limit(client, time_limit):
+    res = client.post("/api/tsume", json={"sfen": STARTPOS, "time_limit": time_limit})
+    assert res.status_code == 400
@@ -0,0 +1,31 @@
+import cshogi
+
+from opening_book import HEADER, RECORD, BookBuilder, OpeningBook
+
+
+def test_book_round_trip(tmp_path):
+    builder = BookBuilder()
+    builder.add_usi_line("startpos moves 7g7f 3c3d 2g2f")
+    builder.add_usi_line("position startpos moves 7g7f 8c8d")
+    path = str(tmp_path / "book.bin")
+    assert builder.write(path) == 4
+    assert not (tmp_path / "book.bin.tmp").exists()
+
+    board = cshogi.Board()
+    book = OpeningBook(path)
+    try:
+        assert book.count == 4
+        assert (tmp_path / "book.bin").stat().st_size == HEADER.size + 4 * RECORD.size
+        assert book.probe(board.zobrist_hash()) == [(board.move_from_usi("7g7f"), 2)]
+        board.push_usi("7g7f")
+        assert sorted(book.probe(board.zobrist_hash())) == sorted(
+            [(board.move_from_usi("3c3d"), 1), (board.move_from_usi("8c8d"), 1)])
+        board.push_usi("3c3d")
+        assert book.probe(board.zobrist_hash()) == [(board.move_from_usi("2g2f"), 1)]
+        board.push_usi("2g2f")
+        assert book.probe(board.zobrist_hash()) == []
+        # レコードは局面ハッシュ順に並ぶ（probe の二分探索の前提）
+        keys = [book._key_at(i) for i in range(book.count)]
+        assert keys == sorted(keys)
+    finally:
+        book.close()